@@ -38,7 +38,9 @@ ReactDOM.render(
   document.getElementById('app'),
 );
 
-const socket = new WebSocket(`ws://${document.domain}:${PORT}/socket`);
+// Each project is served under its own path, e.g. /ruby/socket
+const base = window.location.pathname.replace(/\/?$/, '/');
+const socket = new WebSocket(`ws://${document.domain}:${PORT}${base}socket`);
 
 socket.addEventListener('message', function (message) {
   const { type, data } = JSON.parse(message.data);
@@ -113,6 +113,18 @@ function PaddingDiffLine({ changes, className, blank, address, diff, text }) {
   );
 }
 
+function DisplacementDiffLine({ className, count, displacement }) {
+  const sign = displacement < 0 ? '-' : '+';
+  const text = `${count} ${count === 1 ? 'item' : 'items'} moved by ${sign}0x${Math.abs(displacement).toString(16)}`;
+
+  return (
+    <div className={classNames('row', className)} >
+      <Gutter blank />
+      <Cell className="displacement"><Pre>{text}</Pre></Cell>
+    </div>
+  );
+}
+
 function DiffLine(props) {
   const className = classNames({
     insert: !props.blank && props.opcode === '+',
@@ -126,6 +138,8 @@ function DiffLine(props) {
       return <DataDiffLine className={className} {...props} />;
     case 'padding':
       return <PaddingDiffLine className={className} {...props} />;
+    case 'displacement':
+      return <DisplacementDiffLine className={className} {...props} />;
   }
 }
 
@@ -142,6 +156,10 @@ function InlineDiff({ description, diff }) {
       };
     }
 
+    if (item.type === 'displacement') {
+      return item;
+    }
+
     if (expectedNextAddress && item.address !== expectedNextAddress) {
       throw new Error(
         'Disassembly item did not begin where the last one end ended: ' +
@@ -186,8 +204,16 @@ function SideBySideDiff({ diff }) {
   // Ensure the respective sides have blank spaces for insertions/deletions, and remove
   // any replacement changes (i.e. diffs that are not a whole line but inside the line)
   // that do not belong on that side.
+  // Displaced items are only sent once, with the original address and
+  // the text and label of the modified item
+  const displace = (item) => item.displacement && item.type !== 'displacement' ? {
+    ...item,
+    ...item.modified,
+    address: item.address + item.displacement,
+  } : item;
+
   const left = R.reject(R.propEq('opcode', '>'), R.map(prepareLines('+'), diff));
-  const right = R.reject(R.propEq('opcode', '<'), R.map(prepareLines('-'), diff));
+  const right = R.reject(R.propEq('opcode', '<'), R.map(R.compose(displace, prepareLines('-')), diff));
 
   return (
     <div className="diff-side-by-side">
@@ -4,11 +4,12 @@ import Loader from 'halogen/MoonLoader';
 import BodyClasses from '../BodyClasses';
 import './styles.scss';
 
-export default function LoadingOverlay() {
+export default function LoadingOverlay({ message }) {
   return (
     <BodyClasses className="overlay">
       <div className="loading-overlay">
         <Loader color="#cccccc" size="160px" margin="4px"/>
+        {message && <h1>{message}</h1>}
       </div>
     </BodyClasses>
   );
@@ -0,0 +1,17 @@
+import React from 'react';
+
+import './styles.scss';
+
+function percentage(part, total) {
+  return total ? `${(100 * part / total).toFixed(1)}%` : '0%';
+}
+
+export default function Progress({ progress }) {
+  const { matching, functions, matching_size, size } = progress;
+
+  return (
+    <div className="progress">
+      {matching}/{functions} functions match ({percentage(matching_size, size)} of code)
+    </div>
+  );
+}
@@ -5,14 +5,16 @@ import Diff from '../../components/Diff';
 import LoadingOverlay from '../../components/LoadingOverlay';
 import ErrorOverlay from '../../components/ErrorOverlay';
 import MatchOverlay from '../../components/MatchOverlay';
+import Progress from '../../components/Progress';
 
-function App({ match, diff, error, loading }) {
+function App({ match, diff, error, loading, warmingUp, progress }) {
   return (
     <div>
-      {loading && <LoadingOverlay />}
+      {(loading || warmingUp) && <LoadingOverlay message={warmingUp ? 'Warming up' : null} />}
       {error && <ErrorOverlay message={error} />}
       {match && <MatchOverlay />}
       <Diff diff={diff} />
+      {progress && <Progress progress={progress} />}
     </div>
   );
 }
@@ -21,8 +23,10 @@ function mapStateToProps(state) {
   return {
     diff: state.messages.diff,
     loading: state.messages.building,
+    warmingUp: state.messages.warmingUp,
     error: state.messages.error,
     match: state.messages.match,
+    progress: state.messages.progress,
   };
 }
 
@@ -3,12 +3,24 @@ import { RECEIVE_MESSAGE } from '../constants';
 const initialState = {
   diff: [],
   building: false,
+  warmingUp: false,
   error: null,
   match: false,
+  progress: null,
 };
 
 function handleMessage(state, event, data) {
   switch (event) {
+    case 'warming_up':
+      return {
+        ...state,
+        warmingUp: true,
+      };
+    case 'ready':
+      return {
+        ...state,
+        warmingUp: false,
+      };
     case 'building':
       return {
         ...state,
@@ -28,11 +40,17 @@ function handleMessage(state, event, data) {
         building: false,
         match: true,
       };
+    case 'progress':
+      return {
+        ...state,
+        progress: data,
+      };
     case 'build_error':
       return {
         ...state,
         error: data,
         building: false,
+        warmingUp: false,
       };
     default:
       console.log(event);
@@ -0,0 +1,101 @@
+import os.path
+import logging
+import subprocess
+
+
+class BuildError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+def _is_make_message(line):
+    return line.startswith('make') and (
+        'Entering directory' in line or
+        'Leaving directory' in line or
+        'Nothing to be done' in line or
+        'is up to date' in line
+    )
+
+
+class FastBuilder:
+    """
+    Rebuilds a changed source file by running the commands that make would
+    run for it, recorded once with a dry run, instead of having make
+    evaluate the whole dependency graph on every change. The commands
+    compile the object for the source file and then relink.
+    """
+    def __init__(self, directory, logger=None):
+        self._logger = logger or logging.getLogger('pokerubydiff')
+        self._directory = directory
+        self._commands = {}
+
+    def reset(self):
+        """
+        Forget the recorded commands, e.g. because files were added to the
+        build and the link command changed.
+        """
+        self._commands = {}
+
+    def _makefile_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(self._directory, 'Makefile'))
+        except OSError:
+            return None
+
+    def _record(self, path):
+        """
+        Ask make which commands it would run if `path` had changed.
+        """
+        # make only matches the path as it is written in the Makefile
+        path = os.path.relpath(path, self._directory)
+        proc = subprocess.run(['make', '--dry-run', '--what-if', path], cwd=self._directory,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        if proc.returncode != 0:
+            return []
+
+        commands = []
+        for line in proc.stdout.decode().replace('\\\n', ' ').splitlines():
+            if line.strip() and not _is_make_message(line):
+                commands.append(line)
+
+        return commands
+
+    def build(self, path):
+        """
+        Rebuild after a change to `path`. Returns False if the commands for it
+        could not be determined, in which case make has to be run instead.
+        """
+        mtime = self._makefile_mtime()
+        recorded = self._commands.get(path)
+
+        # The recorded commands are stale if the Makefile has changed since
+        if recorded != None and recorded[0] == mtime:
+            if not recorded[1]:
+                return False
+
+            self._run(recorded[1])
+            return True
+
+        self._logger.info('Recording build commands for {}'.format(path))
+        commands = self._record(path)
+
+        if not commands:
+            self._commands[path] = (mtime, commands)
+            return False
+
+        self._run(commands)
+
+        # The dry run also lists any other targets that were out of date,
+        # e.g. after a failed build, so the commands that are kept are
+        # recorded again once the build is up to date
+        self._commands[path] = (mtime, self._record(path))
+        return True
+
+    def _run(self, commands):
+        for command in commands:
+            proc = subprocess.run(command, shell=True, cwd=self._directory,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            if proc.returncode != 0:
+                raise BuildError(proc.stderr.decode())
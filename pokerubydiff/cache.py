@@ -0,0 +1,111 @@
+import collections
+
+
+class DiffCache:
+    """
+    A bounded least recently used cache of diff outputs. Each entry is
+    weighed by its size, e.g. the number of diff rows, and the least
+    recently used entries are evicted once the total size exceeds
+    `max_size`.
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def size(self):
+        return self._size
+
+    def get(self, key, default=None):
+        try:
+            value, _ = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, size=1):
+        if key in self._entries:
+            _, old_size = self._entries.pop(key)
+            self._size -= old_size
+
+        # Entries that would evict everything else are not worth caching
+        if size > self.max_size:
+            return
+
+        self._entries[key] = (value, size)
+        self._size += size
+
+        while self._size > self.max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'size': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class DecodeCache:
+    """
+    A bounded cache of decoded instructions, keyed by the address and bytes
+    of each instruction. It can be shared between disassemblers of different
+    binaries and threads: lookups and insertions are single dictionary
+    operations, and the cache is simply emptied once it holds `max_size`
+    instructions rather than tracking which entries were used last.
+    """
+    def __init__(self, max_size=1 << 20):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        value = self._entries.get(key, default)
+
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+
+        self._entries[key] = value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,169 @@
+import array
+import hashlib
+import logging
+from . import disasm
+
+HASH_NAME = 'sha1'
+
+# Errors raised by the disassembler on code it is unable to follow
+DISASM_ERRORS = (AssertionError, RuntimeError, ValueError, IndexError, KeyError)
+
+
+def function_digest(data, address, size):
+    """
+    Hash the bytes of the function at `address`.
+    """
+    offset = disasm.address_to_offset(address)
+    return hashlib.new(HASH_NAME, data[offset:offset+size]).digest()
+
+
+class FunctionEntry:
+    __slots__ = ('address', 'size', 'digest', 'calls', 'references')
+
+    def __init__(self, address, size, digest, calls, references):
+        self.address = address
+        self.size = size
+        self.digest = digest
+        self.calls = calls
+        self.references = references
+
+
+class CallGraph:
+    """
+    An index of the calls and literal pool references of every function
+    symbol in a ROM. Functions are keyed by name, so the index can be
+    updated from successive builds, and only functions whose bytes changed
+    since the last update are disassembled again.
+    """
+    def __init__(self, decode_cache=None, logger=None):
+        self._logger = logger or logging.getLogger('pokerubydiff')
+        self._decode_cache = decode_cache
+        self._functions = {}
+        self._callers = None
+
+    def _index_function(self, disassembler, address, symbols):
+        calls = set()
+        references = array.array('I')
+
+        try:
+            function = disassembler.analyse(address, symbols)
+        except DISASM_ERRORS as e:
+            self._logger.debug('Could not disassemble 0x{:08X}: {!r}'.format(address, e))
+            return (), references
+
+        for item in function.items:
+            if item.type() != 'code':
+                continue
+
+            for dataref in item.data_references():
+                references.append(dataref.value)
+
+            if item.is_call() and item.id() == disasm.capstone.arm.ARM_INS_BL:
+                lookup = symbols.lookup(item.operands()[0].imm)
+                if lookup and lookup.disp == 0:
+                    calls.add(lookup.symbol.name)
+
+        return tuple(sorted(calls)), references
+
+    def update(self, data, symbols):
+        """
+        Index the function symbols of `symbols` in the ROM `data`. Returns the
+        names of the functions that were added or whose bytes changed.
+        """
+        disassembler = disasm.Disassembler(data, self._decode_cache)
+        functions = {}
+        changed = set()
+
+        for symbol in symbols.functions():
+            if symbol.size == 0:
+                continue
+
+            address = symbol.value & 0xFFFFFFFE # Ignore THUMB bit
+
+            try:
+                digest = function_digest(data, address, symbol.size)
+            except ValueError:
+                continue
+
+            entry = self._functions.get(symbol.name)
+
+            if entry is None or entry.digest != digest:
+                calls, references = self._index_function(disassembler, address, symbols)
+                entry = FunctionEntry(address, symbol.size, digest, calls, references)
+                changed.add(symbol.name)
+            elif entry.address != address:
+                entry = FunctionEntry(address, symbol.size, digest, entry.calls, entry.references)
+
+            functions[symbol.name] = entry
+
+        # Functions that no longer exist are also changes
+        changed.update(self._functions.keys() - functions.keys())
+
+        self._functions = functions
+        if changed:
+            self._callers = None
+
+        return changed
+
+    def __contains__(self, name):
+        return name in self._functions
+
+    def __len__(self):
+        return len(self._functions)
+
+    def calls(self, name):
+        """
+        The names of the functions called by `name`.
+        """
+        entry = self._functions.get(name)
+        return entry.calls if entry else ()
+
+    def references(self, name):
+        """
+        The constants loaded from the literal pools of `name`.
+        """
+        entry = self._functions.get(name)
+        return tuple(entry.references) if entry else ()
+
+    def _build_callers(self):
+        callers = {}
+
+        for name, entry in self._functions.items():
+            for callee in entry.calls:
+                callers.setdefault(callee, []).append(name)
+
+        return {callee: tuple(names) for callee, names in callers.items()}
+
+    def callers(self, name, transitive=False):
+        """
+        The names of the functions that call `name`, or that reach it
+        through any chain of calls if `transitive` is set.
+        """
+        if self._callers is None:
+            self._callers = self._build_callers()
+
+        if not transitive:
+            return set(self._callers.get(name, ()))
+
+        result = set()
+        queue = [name]
+
+        while len(queue):
+            for caller in self._callers.get(queue.pop(), ()):
+                if caller not in result:
+                    result.add(caller)
+                    queue.append(caller)
+
+        result.discard(name)
+        return result
+
+    def affected(self, names):
+        """
+        The callers affected by changes to the functions `names`.
+        """
+        result = set()
+
+        for name in names:
+            result.update(self.callers(name))
+
+        return result - set(names)
@@ -0,0 +1,172 @@
+import os.path
+import logging
+import subprocess
+from . import symbols
+
+
+def parse_dependencies(text):
+    """
+    Parse make rules of the form `target: prerequisite ...`, as written to
+    dependency (.d) files by the compiler or printed by `make -p`. Returns a
+    dictionary mapping each target to a list of its prerequisites.
+    """
+    rules = {}
+
+    # Join continued lines
+    for line in text.replace('\\\n', ' ').splitlines():
+        # Skip recipes, comments and variable assignments
+        if not line or line.startswith(('\t', '#')):
+            continue
+
+        targets, sep, prerequisites = line.partition(':')
+        if not sep or prerequisites.startswith(('=', ':')) or '=' in targets:
+            continue
+
+        # Skip target-specific variables, e.g. `a.o: CFLAGS += -O2`
+        prerequisites = prerequisites.split(';')[0]
+        if '=' in prerequisites:
+            continue
+
+        # Order-only prerequisites aren't needed for the target to be rebuilt
+        prerequisites = prerequisites.split('|')[0]
+
+        for target in targets.split():
+            if '%' in target or '$' in target or target.startswith('.'):
+                continue
+
+            rules.setdefault(target, []).extend(
+                p for p in prerequisites.split() if '$' not in p and '%' not in p
+            )
+
+    return rules
+
+
+class DependencyIndex:
+    """
+    A reverse dependency index of the object files built by make, mapping
+    each source file and header to the objects that have to be rebuilt
+    when it changes. The objects and their prerequisites are read from
+    make's database, and the dependency (.d) files of those objects add
+    the headers found by the compiler.
+    """
+    def __init__(self, directory, logger=None):
+        self._logger = logger or logging.getLogger('pokerubydiff')
+        self._directory = directory
+        self._rules = {}
+        self._objects = {}
+
+    def _path(self, path, base=None):
+        return os.path.normpath(os.path.join(base or self._directory, path))
+
+    def _load_make_database(self):
+        # -q stops make from running any recipes while it prints its database
+        proc = subprocess.run(['make', '-p', '-q'], cwd=self._directory,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        rules = parse_dependencies(proc.stdout.decode(errors='replace'))
+
+        return {
+            self._path(target): {self._path(p) for p in prerequisites}
+            for target, prerequisites in rules.items() if target.endswith('.o')
+        }
+
+    def _load_depfiles(self, objects):
+        """
+        Read the prerequisites of `objects` from their dependency files,
+        which the compiler writes next to each object. The paths in a
+        dependency file are relative to the directory the compiler ran in,
+        which is either the directory of the file or the project.
+        """
+        rules = {}
+
+        for obj in objects:
+            filename = os.path.splitext(obj)[0] + '.d'
+
+            try:
+                with open(filename) as f:
+                    depfile = parse_dependencies(f.read())
+            except OSError:
+                continue
+
+            for target, prerequisites in depfile.items():
+                for base in (os.path.dirname(filename), self._directory):
+                    path = self._path(target, base)
+
+                    if path in objects:
+                        rules.setdefault(path, set()).update(
+                            self._path(p, base) for p in prerequisites
+                        )
+                        break
+
+        return rules
+
+    def _update(self):
+        depfiles = self._load_depfiles(self._rules)
+
+        objects = {}
+        for rules in (self._rules, depfiles):
+            for target, prerequisites in rules.items():
+                for prerequisite in prerequisites:
+                    objects.setdefault(prerequisite, set()).add(target)
+
+        self._objects = objects
+
+    def load(self):
+        """
+        Rebuild the index from make's database and the dependency files.
+        """
+        self._rules = self._load_make_database()
+        self._update()
+        self._logger.info('Found {} build dependencies'.format(len(self._objects)))
+
+    def refresh(self):
+        """
+        Reload the dependency files after a build. They are cheap to reload
+        and change with each build, whereas make's database is only read
+        again when the index is loaded.
+        """
+        self._update()
+        self._logger.debug('Found {} build dependencies'.format(len(self._objects)))
+
+    def __len__(self):
+        return len(self._objects)
+
+    def is_relevant(self, path):
+        """
+        Whether changing the file at `path` affects the build.
+        """
+        return path in self._objects
+
+    def objects(self, path):
+        """
+        The object files that are rebuilt when the file at `path` changes.
+        """
+        return set(self._objects.get(path, ()))
+
+    def functions(self, path):
+        """
+        The names of the functions in the object files that are rebuilt when
+        the file at `path` changes.
+        """
+        names = set()
+
+        for obj in self.objects(path):
+            try:
+                with open(obj, 'rb') as f:
+                    object_symbols = symbols.Symbols(f)
+            except (OSError, ValueError, symbols.elf.error):
+                continue
+
+            names.update(symbol.name for symbol in object_symbols.functions())
+
+        return names
+
+    def directories(self):
+        """
+        The directories inside the project that contain dependencies.
+        """
+        directory = os.path.join(self._directory, '')
+
+        return {
+            os.path.dirname(path) for path in self._objects
+            if path.startswith(directory)
+        }
@@ -9,8 +9,13 @@ class DisasmDiff:
     This is a clone of the parts of difflib that weren't adequately able
     to diff non-text and provide the result as meta data rather than text.
     """
-    def __init__(self):
+    def __init__(self, html=None, normalize=False):
         self.charjunk = None
+        self.html = html
+
+        # Compare the location independent rendering of the items, and
+        # summarise displaced code with one row per block
+        self.normalize = normalize
 
     def _tabs2spaces(self, line, spaces=8):
         """
@@ -31,8 +36,15 @@ class DisasmDiff:
 
         return res
 
+    def _render(self, item):
+        # The text that items are compared by
+        if self.normalize:
+            return item.normalized()
+
+        return str(item)
+
     def _prepare_lines(self, items):
-        return [str(item) + '\n' for item in items]
+        return [self._render(item) + '\n' for item in items]
 
     def _tag_item(self, tag, aitem, bitem):
         # Labels will sometimes skew the output when they
@@ -70,36 +82,15 @@ class DisasmDiff:
             elif tag == 'insert':
                 yield from self._tag_range('+', b[blo:bhi], a[alo:ahi])
             elif tag == 'equal':
-                # The opcodes are equal, but they might have been
-                # displaced by earlier sections of code. This means the
-                # addresses are not necessarily equal (as addresses are
-                # not factored into the diff), and this should be reported
-                # as a replacement.
-                for left, right in zip(self._tag_range(' ', a[alo:ahi], b[blo:bhi]),
-                                       self._tag_range(' ', b[blo:bhi], a[alo:ahi])):
-                    if left['address'] == right['address']:
-                        yield left
-                    else:
-                        changes = {
-                            'address': True,
-                        }
-
-                        yield {
-                            **left,
-                            'opcode': '<',
-                            'changes': changes,
-                        }
-
-                        yield {
-                            **right,
-                            'opcode': '>',
-                            'changes': changes,
-                        }
+                yield from self._equal_range(a[alo:ahi], b[blo:bhi])
             else:
                 raise ValueError('Unkown tag %r' % (tag,))
 
         # TODO: Only debug
-        with open('diff.html', 'w') as html:
+        if self.html is None:
+            return
+
+        with open(self.html, 'w') as html:
             alc = ['{:50}# {:08x}\n'.format(self._tabs2spaces(str(item)),
                                             item.address()) for item in a]
             blc = ['{:50}# {:08x}\n'.format(self._tabs2spaces(str(item)),
@@ -108,6 +99,75 @@ class DisasmDiff:
             htmldiff = difflib.HtmlDiff()
             html.write(htmldiff.make_file(alc, blc))
 
+    def _equal_range(self, ait, bit):
+        """
+        Tag a block of items that render the same on both sides.
+        """
+        if self.normalize:
+            yield from self._displaced_range(ait, bit)
+            return
+
+        # The opcodes are equal, but they might have been
+        # displaced by earlier sections of code. This means the
+        # addresses are not necessarily equal (as addresses are
+        # not factored into the diff), and this should be reported
+        # as a replacement.
+        for left, right in zip(self._tag_range(' ', ait, bit),
+                               self._tag_range(' ', bit, ait)):
+            if left['address'] == right['address']:
+                yield left
+            else:
+                changes = {
+                    'address': True,
+                }
+
+                yield {
+                    **left,
+                    'opcode': '<',
+                    'changes': changes,
+                }
+
+                yield {
+                    **right,
+                    'opcode': '>',
+                    'changes': changes,
+                }
+
+    def _displaced_range(self, ait, bit):
+        """
+        Tag a block of equal items. All the items in the block are displaced
+        by the same amount, so if it has moved it is reported once, followed
+        by the original items. The text and label of each modified item are
+        sent along with it, as labels and branch targets follow the move.
+        """
+        displacement = bit[0].address() - ait[0].address()
+
+        if displacement == 0:
+            yield from self._tag_range(' ', ait, bit)
+            return
+
+        yield {
+            'opcode': '@',
+            'type': 'displacement',
+            'address': ait[0].address(),
+            'size': 0,
+            'count': len(ait),
+            'displacement': displacement,
+            'text': '',
+            'label': None,
+        }
+
+        for left, right in zip(self._tag_range(' ', ait, bit),
+                               self._tag_range(' ', bit, ait)):
+            yield {
+                **left,
+                'displacement': displacement,
+                'modified': {
+                    'text': right['text'],
+                    'label': right['label'],
+                },
+            }
+
     def _plain_replace(self, a, alo, ahi, b, blo, bhi):
         assert alo < ahi and blo < bhi
         # dump the shorter block first -- reduces the burden on short-term
@@ -146,10 +206,10 @@ class DisasmDiff:
         # (identical lines must be junk lines, & we don't want to synch up
         # on junk -- unless we have to)
         for j in range(blo, bhi):
-            bj = str(b[j])
+            bj = self._render(b[j])
             cruncher.set_seq2(bj)
             for i in range(alo, ahi):
-                ai = str(a[i])
+                ai = self._render(a[i])
                 if ai == bj:
                     if eqi is None:
                         eqi, eqj = i, j
@@ -187,24 +247,7 @@ class DisasmDiff:
         aelt, belt = a[best_i], b[best_j]
         if eqi is None:
             # pump out a '-', '?', '+', '?' quad for the synched lines
-            atags = []
-            btags = []
-
-            cruncher.set_seqs(str(aelt), str(belt))
-            for tag, ai1, ai2, bj1, bj2 in cruncher.get_opcodes():
-                if tag == 'replace':
-                    atags.append(('^', ai1, ai2))
-                    btags.append(('^', bj1, bj2))
-                elif tag == 'delete':
-                    atags.append(('-', ai1, ai2))
-                elif tag == 'insert':
-                    btags.append(('+', bj1, bj2))
-                elif tag == 'equal':
-                    # Ignore equal sections as they do not need
-                    # highlighting
-                    pass
-                else:
-                    raise ValueError('unknown tag %r' % (tag,))
+            atags, btags = self._operand_tags(aelt, belt)
 
             # Labels will sometimes skew the output when they
             # are displayed on their own lines, so ensure that
@@ -229,12 +272,31 @@ class DisasmDiff:
             }
         else:
             # the synch pair is identical
-            # TODO:
-            yield '  ' + aelt
+            yield from self._equal_range([aelt], [belt])
 
         # pump out diffs from after the synch point
         yield from self._fancy_helper(a, best_i+1, ahi, b, best_j+1, bhi)
 
+    def _operand_tags(self, aelt, belt):
+        """
+        Mark the differences between two items by comparing their mnemonics
+        and operands pairwise, rather than the characters of the rendered
+        text. Returns the (tag, start, end) ranges to highlight in each item.
+        """
+        atags = []
+        btags = []
+
+        for aspan, bspan in itertools.zip_longest(aelt.spans(), belt.spans()):
+            if bspan is None:
+                atags.append(('-',) + aspan[2:])
+            elif aspan is None:
+                btags.append(('+',) + bspan[2:])
+            elif aspan[:2] != bspan[:2]:
+                atags.append(('^',) + aspan[2:])
+                btags.append(('^',) + bspan[2:])
+
+        return atags, btags
+
     def _fancy_helper(self, a, alo, ahi, b, blo, bhi):
         if alo < ahi:
             if blo < bhi:
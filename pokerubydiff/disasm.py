@@ -1,12 +1,19 @@
 import io
-import itertools
+import sys
 import collections
 import operator
 import capstone
 import capstone.arm
 
-# FIXME: Convert mnemonic checks to: "if i.id in (ARM_INS_BL, ARM_INS_CMP)"
-# TODO: Handle switches
+# Instruction classification flags
+INSN_JUMP = 1 << 0
+INSN_UNCONDITIONAL = 1 << 1
+INSN_CALL = 1 << 2
+INSN_RETURN = 1 << 3
+# A jump within the function: not a call or a return
+INSN_BRANCH = 1 << 4
+# A jump to a computed address, e.g. 'mov pc, rX'
+INSN_INDIRECT = 1 << 5
 
 register_names = collections.OrderedDict({
     capstone.arm.ARM_REG_R0: 'r0',
@@ -66,60 +73,113 @@ def generate_label(address, prefix):
 
 
 class Stack:
-    def __init__(self, stack=[]):
-        self._stack = stack
+    """
+    A persistent stack. Items are stored in a linked list of immutable cells
+    so that cloning only copies the reference to the top of the stack.
+    """
+    __slots__ = ('_head',)
+
+    def __init__(self, head=None):
+        self._head = head
 
     def push(self, item):
-        self._stack.append(item)
+        self._head = (item, self._head)
 
     def pop(self):
-        return self._stack.pop()
+        if self._head is None:
+            raise IndexError('pop from empty stack')
+
+        item, self._head = self._head
+        return item
 
     def clone(self):
-        return Stack(list(self._stack))
+        return Stack(self._head)
+
+
+# Dense index for the tracked registers
+register_index = {reg: i for i, reg in enumerate(register_names)}
 
 
 class Registers:
-    registers = [
-        'r0',
-        'r1',
-        'r2',
-        'r3',
-        'r4',
-        'r5',
-        'r6',
-        'r7',
-        'r8',
-        'r9',
-        'r10',
-        'r11',
-        'r12',
-        'sp',
-        'lr',
-        'pc'
-    ]
-
-    def __init__(self, registers={}):
-        self._registers = dict(zip(self.registers, itertools.repeat(None)))
-        self._registers.update(registers)
+    """
+    The tracked register state. The values are stored in a fixed-size tuple
+    indexed by Capstone register id, which is shared between clones and only
+    copied when a register is written.
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, values=None):
+        self._values = values or (None,) * len(register_index)
 
     def clone(self):
-        return Registers(self._registers)
+        return Registers(self._values)
 
-    def __getitem__(self, key):
-        if key not in self.registers:
-            raise ValueError('Invalid register name: {}'.format(key))
+    def _index(self, key):
+        try:
+            return register_index[key]
+        except KeyError:
+            raise ValueError('Invalid register: {}'.format(key)) from None
 
-        return self._registers[key]
+    def __getitem__(self, key):
+        return self._values[self._index(key)]
 
     def __setitem__(self, key, value):
-        if key not in self.registers:
-            raise ValueError('Invalid register name: {}'.format(key))
-
-        self._registers[key] = value
+        i = self._index(key)
+        values = self._values
+        self._values = values[:i] + (value,) + values[i+1:]
+
+
+class MemOperand(collections.namedtuple('MemOperand', 'base index disp')):
+    """
+    The memory operand fields required for rendering.
+    """
+    __slots__ = ()
+
+
+class Operand(collections.namedtuple('Operand', 'type reg imm mem')):
+    """
+    A compact copy of a Capstone operand. Only the fields used for
+    rendering are kept, so the Capstone instruction can be released
+    once it has been analysed.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_capstone(cls, op):
+        if op.type == capstone.arm.ARM_OP_MEM:
+            mem = MemOperand(op.mem.base, op.mem.index, op.mem.disp)
+            return cls(op.type, 0, 0, mem)
+
+        return cls(op.type, op.reg, op.imm, None)
+
+
+class Decoded(collections.namedtuple('Decoded', 'address size id mnemonic cc groups operands')):
+    """
+    The fields of a decoded Capstone instruction. Decoding only depends on
+    the address and the bytes of the instruction, so the same record can be
+    shared by every function and binary containing those bytes.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_capstone(cls, cs_insn):
+        return cls(
+            cs_insn.address,
+            cs_insn.size,
+            cs_insn.id,
+            sys.intern(cs_insn.mnemonic),
+            cs_insn.cc,
+            tuple(cs_insn.groups),
+            tuple(Operand.from_capstone(op) for op in cs_insn.operands),
+        )
 
 
 class Item:
+    __slots__ = ('_type', '_address', '_size', 'label')
+
+    # Separates the mnemonic or directive from the operands
+    separator = ' '
+
     def __init__(self, type, address, size):
         self._type = type
         self._address = address
@@ -135,125 +195,200 @@ class Item:
     def address(self):
         return self._address
 
+    def tokens(self, normalized=False):
+        """
+        The mnemonic or directive followed by the operands, as a list of
+        (kind, text) tuples.
+        """
+        raise NotImplementedError
+
+    def _join(self, tokens):
+        (_, mnemonic), *operands = tokens
+        return mnemonic + self.separator + ', '.join(text for _, text in operands)
+
+    def spans(self):
+        """
+        Locate the tokens in the rendered item. Returns a list of
+        (kind, text, start, end) tuples.
+        """
+        result = []
+        start = 0
+        separator = self.separator
+
+        for kind, text in self.tokens():
+            result.append((kind, text, start, start + len(text)))
+            start += len(text) + len(separator)
+            separator = ', '
+
+        return result
+
+    def normalized(self):
+        """
+        Render the item without anything that depends on where it is
+        located, so that code which has only moved compares equal.
+        """
+        return self._join(self.tokens(normalized=True))
+
+    def __str__(self):
+        return self._join(self.tokens())
+
 
 class AlignItem(Item):
+    __slots__ = ()
+
     def __init__(self, address, size):
         super().__init__('padding', address, size)
 
-    def __str__(self):
-        return '.align {}'.format(self.size())
+    def tokens(self, normalized=False):
+        return [('directive', '.align'), ('immediate', str(self.size()))]
 
 
 class Data(Item):
-    def __init__(self, data, address, size, symbols):
+    __slots__ = ('value', '_symbols')
+
+    def __init__(self, data, address, size):
         super().__init__('data', address, size)
         offset = address_to_offset(address)
-        self._data = data
-        self.value = int.from_bytes(self._data[offset:offset+size], 'little')
+        self.value = int.from_bytes(data[offset:offset+size], 'little')
+        self._symbols = None
 
+    def tokens(self, normalized=False):
+        lookup = self._symbols and self._symbols.get(self.value)
 
-    def __str__(self):
-        # TODO: Lookup symbol
-        return '.word 0x{:08X}'.format(self.value)
+        if lookup:
+            if lookup.disp > 0:
+                return [('directive', '.word'), ('symbol', '{}+{}'.format(lookup.symbol.name, lookup.disp))]
+            return [('directive', '.word'), ('symbol', lookup.symbol.name)]
+
+        return [('directive', '.word'), ('immediate', '0x{:08X}'.format(self.value))]
 
 
 class Insn(Item):
-    def __init__(self, data, cs_insn, stack, registers, symbols):
-        super().__init__('code', cs_insn.address, cs_insn.size)
-        self._insn = cs_insn
-        self._data = data
-        self._symbols = symbols
+    """
+    A decoded instruction. The fields needed for rendering are taken from
+    the decoded record and the text is only built when the instruction is
+    rendered.
+    """
+    __slots__ = ('_id', '_mnemonic', '_groups', '_operands', '_datarefs',
+                 '_symbols', 'flags')
+
+    separator = '\t'
+
+    def __init__(self, data, decoded, stack, registers):
+        super().__init__('code', decoded.address, decoded.size)
+        self._id = id = decoded.id
+        self._mnemonic = decoded.mnemonic
+        self._groups = decoded.groups
+        self._operands = decoded.operands
+        self._symbols = None
 
         # Modify the stack
-        if self._insn.mnemonic == 'push':
-            for op in reversed(self._insn.operands):
-                stack.push(self._insn.reg_name(op.reg))
-        elif self._insn.mnemonic == 'pop':
-            for op in self._insn.operands:
-                reg_name = self._insn.reg_name(op.reg)
-                prev_reg_name = stack.pop()
-                registers[reg_name] = prev_reg_name
+        if id == capstone.arm.ARM_INS_PUSH:
+            for op in reversed(self._operands):
+                stack.push(op.reg)
+        elif id == capstone.arm.ARM_INS_POP:
+            for op in self._operands:
+                registers[op.reg] = stack.pop()
 
-        self.stack = stack
-        self.registers = registers
+        # Classify the instruction once. The register state is only needed
+        # to detect returns, so it is not kept once the flags are known.
+        self.flags = self._classify(decoded.cc, registers)
 
         # Detect literal pool loads
-        self._datarefs = []
+        self._datarefs = ()
 
-        if self._insn.mnemonic == 'ldr':
-            assert len(self._insn.operands) == 2
-            base = self._insn.reg_name(self._insn.operands[1].mem.base)
-
-            if base == 'pc':
-                disp = self._insn.operands[1].mem.disp
+        if id == capstone.arm.ARM_INS_LDR:
+            assert len(self._operands) == 2
+            if self._operands[1].mem.base == capstone.arm.ARM_REG_PC:
+                disp = self._operands[1].mem.disp
 
                 # 5.6.2. LDR Thumb pseudo-instruction:
                 # "The offset from the pc to the constant must be positive and less than 1KB."
                 assert disp >= 0
 
                 size = 4
-                address = self._insn.address + disp + (4 if self._insn.address % 4 == 0 else 2)
-                self._datarefs.append(Data(self._data, address, size, self._symbols))
+                address = self.address() + disp + (4 if self.address() % 4 == 0 else 2)
+                self._datarefs = (Data(data, address, size),)
 
-    def data_references(self):
-        return self._datarefs
+    def _classify(self, cc, registers):
+        id = self._id
+        flags = 0
 
-    def is_return(self):
-        if self._insn.mnemonic == 'bx':
-            assert len(self._insn.operands) == 1
-            reg_name = self._insn.reg_name(self._insn.operands[0].reg)
+        if capstone.arm.ARM_GRP_JUMP in self._groups:
+            flags |= INSN_JUMP
+
+        if id == capstone.arm.ARM_INS_B and cc == capstone.arm.ARM_CC_AL:
+            flags |= INSN_UNCONDITIONAL
+
+        if id == capstone.arm.ARM_INS_BX:
+            assert len(self._operands) == 1
+            reg = self._operands[0].reg
 
-            if reg_name == 'lr':
+            if reg == capstone.arm.ARM_REG_LR:
                 # Detect 'bx lr' return
-                return True
-            elif self.registers[reg_name] == 'lr':
+                flags |= INSN_RETURN
+            elif registers[reg] == capstone.arm.ARM_REG_LR:
                 # Detect arm-thumb interworking return
-                return True
+                flags |= INSN_RETURN
             else:
-                return False
-        elif self._insn.mnemonic == 'pop':
+                # Detect long-call
+                # FIXME: Detect BX as long jump
+                flags |= INSN_CALL
+        elif id == capstone.arm.ARM_INS_POP:
             # Detect non arm-thumb interworking return
-            return self.registers['pc'] == 'lr'
+            if registers[capstone.arm.ARM_REG_PC] == capstone.arm.ARM_REG_LR:
+                flags |= INSN_RETURN
+        elif id == capstone.arm.ARM_INS_BL:
+            flags |= INSN_CALL
+        elif id == capstone.arm.ARM_INS_MOV:
+            if self._operands[0].reg == capstone.arm.ARM_REG_PC:
+                flags |= INSN_INDIRECT
+
+        # Jumps within the function
+        if flags & (INSN_JUMP | INSN_CALL | INSN_RETURN) == INSN_JUMP:
+            flags |= INSN_BRANCH
+
+        return flags
+
+    def id(self):
+        return self._id
+
+    def operands(self):
+        return self._operands
+
+    def data_references(self):
+        return self._datarefs
 
-        return False
+    def is_return(self):
+        return bool(self.flags & INSN_RETURN)
 
     def is_jump(self):
-        # FIXME: Use constants
-        return 'jump' in [self._insn.group_name(x) for x in self._insn.groups]
+        return bool(self.flags & INSN_JUMP)
 
     def is_unconditional_jump(self):
-        return self._insn.id == capstone.arm.ARM_INS_B and self._insn.cc == capstone.arm.ARM_CC_AL
+        return bool(self.flags & INSN_UNCONDITIONAL)
 
     def jump_address(self):
-        assert self.is_jump()
-        assert self._insn.mnemonic != 'bx' # Can't get the address for a BX
-        assert len(self._insn.operands) == 1
-        return self._insn.operands[0].imm
+        assert self.flags & INSN_JUMP
+        assert self._id != capstone.arm.ARM_INS_BX # Can't get the address for a BX
+        assert len(self._operands) == 1
+        return self._operands[0].imm
 
     def is_call(self):
-        # FIXME: Detect BX/BL as long jump
+        return bool(self.flags & INSN_CALL)
 
-        if self._insn.mnemonic == 'bx':
-            # Detect long-call
-            return not self.is_return()
-        if self._insn.mnemonic == 'bl':
-            return True
-
-        return False
-
-    def __str__(self):
-        mnemonic = self._insn.mnemonic
-        op_str = self._insn.op_str
-        id = self._insn.id
-        groups = self._insn.groups
+    def tokens(self, normalized=False):
+        mnemonic = self._mnemonic
+        id = self._id
+        groups = self._groups
 
         # TODO: Other reglists (LDMIA, etc.)
         if id in (capstone.arm.ARM_INS_POP, capstone.arm.ARM_INS_PUSH):
-            reglist = self._insn.operands
-            operands = []
+            reglist = self._operands
+            operands = ()
         else:
-            reglist = []
-            operands = self._insn.operands
+            reglist = ()
+            operands = self._operands
 
         ops = []
 
@@ -270,18 +405,18 @@ class Insn(Item):
         elif id == capstone.arm.ARM_INS_LDR:
             if operands[1].mem.base == capstone.arm.ARM_REG_PC:
                 # TODO: Get symbol in the middle
-                lookup = self._symbols and self._symbols.lookup(self._datarefs[0].value)
+                lookup = self._symbols and self._symbols.get(self._datarefs[0].value)
 
-                ops.append(register_names[operands[0].reg])
+                ops.append(('register', register_names[operands[0].reg]))
 
                 if lookup:
                     assert lookup.disp >= 0
                     if lookup.disp > 0:
-                        ops.append('={}+{}'.format(lookup.symbol.name, lookup.disp))
+                        ops.append(('symbol', '={}+{}'.format(lookup.symbol.name, lookup.disp)))
                     else:
-                        ops.append('={}'.format(lookup.symbol.name))
+                        ops.append(('symbol', '={}'.format(lookup.symbol.name)))
                 else:
-                    ops.append('=0x{:08x}'.format(self._datarefs[0].value))
+                    ops.append(('immediate', '=0x{:08x}'.format(self._datarefs[0].value)))
 
                 operands = []
 
@@ -295,139 +430,305 @@ class Insn(Item):
                     disp = register_names[op.mem.index]
                 else:
                     disp = build_imm(op.mem.disp)
-                ops.append('[{}, {}]'.format(register_names[op.mem.base], disp))
+                ops.append(('memory', '[{}, {}]'.format(register_names[op.mem.base], disp)))
             elif op.type == capstone.arm.ARM_OP_REG:
-                ops.append(register_names[op.reg])
+                ops.append(('register', register_names[op.reg]))
             elif op.type == capstone.arm.ARM_OP_IMM:
-                if capstone.arm.ARM_GRP_JUMP in groups:
-                    ops.append(generate_label(op.imm, 'loc'))
+                if normalized and id == capstone.arm.ARM_INS_BL:
+                    # Calls are identified by name and jumps by their distance
+                    lookup = self._symbols and self._symbols.get(op.imm)
+
+                    if lookup and lookup.disp == 0:
+                        ops.append(('symbol', lookup.symbol.name))
+                    else:
+                        ops.append(('label', '.{:+#x}'.format(op.imm - self.address())))
+                elif normalized and capstone.arm.ARM_GRP_JUMP in groups:
+                    ops.append(('label', '.{:+#x}'.format(op.imm - self.address())))
+                elif capstone.arm.ARM_GRP_JUMP in groups:
+                    ops.append(('label', generate_label(op.imm, 'loc')))
                 elif id == capstone.arm.ARM_INS_BL:
                     # Lookup THUMB function
-                    lookup = self._symbols and self._symbols.lookup(op.imm)
+                    lookup = self._symbols and self._symbols.get(op.imm)
 
                     if lookup:
-                        ops.append(lookup.symbol.name)
+                        ops.append(('symbol', lookup.symbol.name))
                     else:
-                        ops.append('0x{:08x}'.format(op.imm))
+                        ops.append(('immediate', '0x{:08x}'.format(op.imm)))
                 else:
-                    ops.append(build_imm(op.imm))
+                    ops.append(('immediate', build_imm(op.imm)))
 
         # Build register list
-        if len(reglist) > 0: ops.append(build_reglist(op.reg for op in reglist))
+        if len(reglist) > 0: ops.append(('reglist', build_reglist(op.reg for op in reglist)))
 
-        return '{}\t{}'.format(mnemonic, ', '.join(ops))
+        return [('mnemonic', mnemonic)] + ops
 
 
-class CodePath:
-    def __init__(self, md, data, address, stack, registers, symbols):
-        offset = address_to_offset(address)
-
-        data_slice = data[offset:]
-        self._md = md
-        self._data = data
-        self._disasm = md.disasm(data_slice, address)
-        self._stopped = False
-        self._symbols = symbols
+class BasicBlock:
+    """
+    A run of instructions that is only entered at the start and only
+    left at the end.
+    """
+    __slots__ = ('address', 'size', 'successors')
 
+    def __init__(self, address, size, successors):
         self.address = address
-        self.stack = stack.clone()
-        self.registers = registers.clone()
+        self.size = size
+        self.successors = successors
 
-    def __iter__(self):
-        return self
 
-    def __next__(self):
-        if self._stopped:
-            raise StopIteration
+class Function:
+    """
+    A disassembled function: the items in address order, including
+    padding, and the basic block graph of the code.
+    """
+    __slots__ = ('address', 'items', 'blocks')
 
-        try:
-            insn = Insn(self._data, next(self._disasm), self.stack, self.registers, self._symbols)
-        except StopIteration:
-            raise RuntimeError('Unexepected EOF')
+    def __init__(self, address, items, blocks):
+        self.address = address
+        self.items = items
+        self.blocks = blocks
 
-        # Stop next iteration for non-call jumps and returns
-        if insn.is_return() or (insn.is_jump() and not insn.is_call()):
-            self._stopped = True
 
-        return insn
+class CodePath:
+    """
+    A pending entry on the disassembler worklist, along with the state
+    tracked up until that point.
+    """
+    __slots__ = ('address', 'stack', 'registers', 'bound', 'table')
+
+    def __init__(self, address, stack, registers, bound=None, table=None):
+        self.address = address
+        self.stack = stack
+        self.registers = registers
+
+        # The last compared immediate and loaded literal, used to
+        # recover switch statement jump tables
+        self.bound = bound
+        self.table = table
 
     def branch(self, address):
         """
         Branch this code path.
         """
         return CodePath(
-            self._md,
-            self._data,
             address,
             self.stack.clone(),
             self.registers.clone(),
-            self._symbols,
+            self.bound,
+            self.table,
         )
 
 
 class Disassembler:
-    def __init__(self, data):
+    def __init__(self, data, decode_cache=None):
         self.data = data
+        self.decode_cache = decode_cache
         self.md = capstone.Cs(
             capstone.CS_ARCH_ARM,
             capstone.CS_MODE_THUMB | capstone.CS_MODE_LITTLE_ENDIAN
         )
         self.md.detail = True
 
-    def disassemble(self, address, symbols=None):
-        queue = [CodePath(self.md, self.data, address, Stack(), Registers(), symbols)]
-        visited = set()
+    def _decode(self, address):
+        # Only pass the bytes of a single instruction to Capstone, as
+        # it would otherwise decode everything up to the end of the data
+        offset = address_to_offset(address)
+        code = bytes(self.data[offset:offset+4])
+
+        if self.decode_cache is not None:
+            key = (address, code)
+            decoded = self.decode_cache.get(key)
+            if decoded is not None:
+                return decoded
+
+        try:
+            decoded = Decoded.from_capstone(next(self.md.disasm(code, address, 1)))
+        except StopIteration:
+            raise RuntimeError('Unexepected EOF')
+
+        if self.decode_cache is not None:
+            self.decode_cache.put(key, decoded)
+
+        return decoded
+
+    def _function_end(self, address, symbols):
+        lookup = symbols and symbols.lookup(address)
+
+        if lookup and lookup.disp == 0 and lookup.symbol.size:
+            return address + lookup.symbol.size
+
+    def _jump_table(self, path, start, end):
+        """
+        Recover the targets of a GCC THUMB switch statement:
+
+                cmp     rX, #<cases - 1>
+                bhi     <default>
+                lsl     rX, rX, #2
+                ldr     rY, =<table>
+                add     rX, rX, rY
+                ldr     rX, [rX]
+                mov     pc, rX
+        """
+        if path.bound is None or path.table is None:
+            return ()
+
+        entries = []
+
+        for i in range(path.bound + 1):
+            address = path.table + i * 4
+
+            try:
+                entry = Data(self.data, address, 4)
+            except ValueError:
+                break
+
+            target = entry.value & 0xFFFFFFFE
+
+            # Stop at anything that cannot be a case label
+            if end is not None and not (start < target < end):
+                break
+
+            entries.append(entry)
+
+        return entries
+
+    def analyse(self, address, symbols=None):
+        """
+        Disassemble the function at `address`. Code is followed from a
+        worklist of code paths, and every address is only decoded once.
+        """
+        entry = address
+        end = self._function_end(address, symbols)
+
+        worklist = [CodePath(address, Stack(), Registers())]
+        insns = {}
+        data = {}
+        successors = {}
+        leaders = {address}
 
-        items = {}
         labels = {
             # TODO: Use name
             address: generate_label(address, 'sub'),
         }
 
-        # Pass over data
-        while len(queue):
-            code_path = queue.pop()
-            visited.add(code_path.address)
+        while len(worklist):
+            path = worklist.pop()
+            address = path.address
+            targets = None
+
+            while targets is None:
+                if address in insns:
+                    # Joined code that has already been decoded
+                    leaders.add(address)
+                    break
 
-            for insn in code_path:
-                items[insn.address()] = insn
+                insn = Insn(self.data, self._decode(address), path.stack, path.registers)
+                insns[address] = insn
 
                 for dataref in insn.data_references():
                     labels[dataref.address()] = generate_label(dataref.address(), 'off')
-                    items[dataref.address()] = dataref
+                    data[dataref.address()] = dataref
+                    path.table = dataref.value
 
-                if not insn.is_return() and (insn.is_jump() and not insn.is_call()):
-                    # Enqueue both branch paths
+                if insn.id() == capstone.arm.ARM_INS_CMP:
+                    op = insn.operands()[1]
+                    path.bound = op.imm if op.type == capstone.arm.ARM_OP_IMM else None
+
+                if insn.flags & INSN_CALL and insn.id() == capstone.arm.ARM_INS_BL:
+                    # BL is also used for long branches within the function
+                    target = insn.operands()[0].imm
+                    if end is not None and entry < target < end:
+                        insn.flags = (insn.flags & ~INSN_CALL) | INSN_JUMP | \
+                            INSN_UNCONDITIONAL | INSN_BRANCH
+
+                if insn.flags & INSN_BRANCH:
                     jump_address = insn.jump_address()
 
-                    # Don't cotinue past unconditional jumps
-                    if insn.is_unconditional_jump():
-                        addresses = (jump_address,)
+                    # Don't continue past unconditional jumps
+                    if insn.flags & INSN_UNCONDITIONAL:
+                        targets = (jump_address,)
                     else:
-                        addresses = (insn.address() + insn.size(), jump_address)
-
-                    for address in addresses:
-                        if address not in visited:
-                            queue.append(code_path.branch(address))
+                        targets = (address + insn.size(), jump_address)
 
                     # Only the jump target gets a label
                     labels[jump_address] = generate_label(jump_address, 'loc')
+                elif insn.flags & INSN_INDIRECT:
+                    entries = self._jump_table(path, entry, end)
+                    targets = tuple(case.value & 0xFFFFFFFE for case in entries)
+
+                    if entries:
+                        table = entries[0].address()
+                        labels[table] = generate_label(table, 'off')
+
+                    for case, target in zip(entries, targets):
+                        data[case.address()] = case
+                        labels[target] = generate_label(target, 'loc')
+                elif insn.flags & INSN_RETURN:
+                    targets = ()
+                else:
+                    address += insn.size()
+
+            if targets is not None:
+                successors[address] = targets
+                leaders.update(targets)
+
+                for target in targets:
+                    if target not in insns:
+                        worklist.append(path.branch(target))
+
+        # Split the code into basic blocks
+        blocks = []
+        start = None
+        for address in sorted(insns):
+            if start is not None and address in leaders:
+                # Fall through into the next block
+                blocks.append(BasicBlock(start, address - start, (address,)))
+                start = None
+
+            if start is None:
+                start = address
+
+            next_address = address + insns[address].size()
+            if address in successors or next_address not in insns:
+                blocks.append(BasicBlock(start, next_address - start, successors.get(address, ())))
+                start = None
+
+        # Resolve every constant and call target of the function at once,
+        # rather than every time an item is rendered
+        if symbols:
+            references = [item.value for item in data.values()]
+            references.extend(
+                insn.operands()[0].imm for insn in insns.values()
+                if insn.id() == capstone.arm.ARM_INS_BL
+            )
+            symbol_map = symbols.lookup_many(references)
+        else:
+            symbol_map = {}
+
+        items = dict(insns)
+        items.update(data)
 
-        # Sort by address
-        items = map(operator.itemgetter(1), sorted(items.items(), key=operator.itemgetter(0)))
+        for item in items.values():
+            item._symbols = symbol_map
 
-        # Uncover holes in output and label the instructions
+        # Sort by address and uncover holes in the output
+        result = []
         predicted_next_address = None
-        for item in items:
-            if predicted_next_address != None and predicted_next_address != item.address():
+        for address, item in sorted(items.items(), key=operator.itemgetter(0)):
+            if predicted_next_address != None and predicted_next_address != address:
                 # A hole in the output will always occur after the predicted next address
                 # if not, the size of the item was incorrect
-                assert item.address() >= predicted_next_address
-                size = item.address() - predicted_next_address
-                yield AlignItem(predicted_next_address, size)
+                assert address >= predicted_next_address
+                size = address - predicted_next_address
+                result.append(AlignItem(predicted_next_address, size))
 
             # Label the items
-            item.label = labels.get(item.address())
+            item.label = labels.get(address)
 
-            predicted_next_address = item.address() + item.size()
-            yield item
+            predicted_next_address = address + item.size()
+            result.append(item)
+
+        return Function(entry, result, blocks)
+
+    def disassemble(self, address, symbols=None):
+        yield from self.analyse(address, symbols).items
@@ -0,0 +1,184 @@
+import collections
+import logging
+from . import disasm
+from .callgraph import DISASM_ERRORS, function_digest
+
+# The number of consecutive instructions in each fingerprint n-gram
+NGRAM_SIZE = 4
+
+# The number of candidates that are scored exactly for each match
+CANDIDATES = 8
+
+# N-grams shared by more functions than this are too common to be used to
+# find candidates, e.g. prologues and epilogues
+MAX_POSTINGS = 256
+
+# Functions with fewer distinct n-grams than this are too short to be
+# matched reliably, e.g. stubs that only return a constant
+MIN_NGRAMS = 4
+
+
+def fingerprint(items, n=NGRAM_SIZE):
+    """
+    Build the fingerprint of a disassembled function: the set of hashes of
+    each run of `n` instruction ids. Instruction ids don't depend on the
+    address of the function or the operands, so moved and lightly modified
+    functions have similar fingerprints.
+    """
+    ids = tuple(item.id() for item in items if item.type() == 'code')
+
+    if len(ids) < n:
+        return frozenset((hash(ids),))
+
+    return frozenset(hash(ids[i:i+n]) for i in range(len(ids) - n + 1))
+
+
+def similarity(a, b):
+    """
+    The Jaccard similarity of two fingerprints.
+    """
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class FingerprintEntry:
+    __slots__ = ('address', 'digest', 'fingerprint')
+
+    def __init__(self, address, digest, fingerprint):
+        self.address = address
+        self.digest = digest
+        self.fingerprint = fingerprint
+
+
+class FunctionMatcher:
+    """
+    An inverted index from fingerprint n-grams to the function symbols of a
+    ROM, used to find the function most similar to a given one without
+    diffing it against every function. Like the call graph, it can be
+    updated from successive builds and only fingerprints functions whose
+    bytes changed.
+    """
+    def __init__(self, decode_cache=None, logger=None):
+        self._logger = logger or logging.getLogger('pokerubydiff')
+        self._decode_cache = decode_cache
+        self._functions = {}
+        self._index = collections.defaultdict(set)
+
+    def __len__(self):
+        return len(self._functions)
+
+    def _add(self, name, entry):
+        self._functions[name] = entry
+
+        for gram in entry.fingerprint:
+            self._index[gram].add(name)
+
+    def _remove(self, name):
+        entry = self._functions.pop(name)
+
+        for gram in entry.fingerprint:
+            names = self._index[gram]
+            names.discard(name)
+
+            if not names:
+                del self._index[gram]
+
+    def update(self, data, symbols):
+        """
+        Fingerprint the function symbols of `symbols` in the ROM `data`.
+        """
+        disassembler = disasm.Disassembler(data, self._decode_cache)
+        names = set()
+
+        for symbol in symbols.functions():
+            if symbol.size == 0:
+                continue
+
+            address = symbol.value & 0xFFFFFFFE # Ignore THUMB bit
+
+            try:
+                digest = function_digest(data, address, symbol.size)
+            except ValueError:
+                continue
+
+            names.add(symbol.name)
+            entry = self._functions.get(symbol.name)
+
+            if entry is not None and entry.digest == digest:
+                entry.address = address
+                continue
+
+            try:
+                items = disassembler.disassemble(address, symbols)
+                entry = FingerprintEntry(address, digest, fingerprint(items))
+            except DISASM_ERRORS as e:
+                self._logger.debug('Could not disassemble 0x{:08X}: {!r}'.format(address, e))
+                names.discard(symbol.name)
+                entry = None
+
+            if symbol.name in self._functions:
+                self._remove(symbol.name)
+
+            if entry is not None:
+                self._add(symbol.name, entry)
+
+        for name in self._functions.keys() - names:
+            self._remove(name)
+
+    def address(self, name):
+        entry = self._functions.get(name)
+        return entry and entry.address
+
+    def names(self):
+        return self._functions.keys()
+
+    def best_match(self, fingerprint, names=None, cutoff=0.5):
+        """
+        Find the indexed function most similar to `fingerprint`, only
+        considering the functions `names` if given. Returns a (name, score)
+        tuple, or None if no function scores at least `cutoff` or the
+        fingerprint is too short. Ties go to the function with the lowest
+        address.
+        """
+        if len(fingerprint) < MIN_NGRAMS:
+            return None
+
+        counts = collections.Counter()
+
+        for gram in fingerprint:
+            postings = self._index.get(gram, ())
+
+            if len(postings) <= MAX_POSTINGS:
+                counts.update(postings)
+
+        if not counts:
+            # Only common n-grams, so fall back to using all of them
+            for gram in fingerprint:
+                counts.update(self._index.get(gram, ()))
+
+        if names is not None:
+            counts = collections.Counter({
+                name: count for name, count in counts.items() if name in names
+            })
+
+        # Sort rather than use most_common, which keeps the order of the
+        # index sets and so varies between runs
+        candidates = sorted(
+            counts,
+            key=lambda name: (-counts[name], self._functions[name].address, name),
+        )[:CANDIDATES]
+
+        best = None
+
+        for name in candidates:
+            score = similarity(fingerprint, self._functions[name].fingerprint)
+
+            if score < cutoff:
+                continue
+
+            if best is None or score > best[1] or (
+                score == best[1] and self._functions[name].address < self._functions[best[0]].address
+            ):
+                best = (name, score)
+
+        return best
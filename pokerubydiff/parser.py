@@ -1,6 +1,5 @@
 import os.path
 import glob
-from clang.cindex import Index, CursorKind
 
 def location_to_function_name(filename, location):
     """
@@ -9,6 +8,9 @@ def location_to_function_name(filename, location):
     at this point, return None.
     """
 
+    # libclang is slow to load, so only import it when it is needed
+    from clang.cindex import Index, CursorKind
+
     index = Index.create()
     tu = index.parse(None, [filename])
 
@@ -0,0 +1,154 @@
+import os
+import atexit
+import signal
+import collections
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+from . import symbols
+from . import disasm
+from . import diff
+from . import cache
+
+# The most binaries a worker process keeps attached. Each build shares a
+# new copy of the modified binary, so older copies are detached.
+ATTACH_LIMIT = 4
+
+# The binaries, symbols and decoded instructions of the current worker process
+_attached = collections.OrderedDict()
+_symbols = {}
+_decode_cache = cache.DecodeCache()
+
+
+class BinaryRef(collections.namedtuple('BinaryRef', 'name size elf')):
+    """
+    The name and size of a binary in shared memory, and the path of the ELF
+    file its symbols are loaded from. This is all that is sent to a worker
+    process to find a binary.
+    """
+    __slots__ = ()
+
+
+class SharedBinary:
+    """
+    A copy of a binary in shared memory. Worker processes attach to it by
+    name, rather than receiving a copy of the binary with every job.
+    """
+    def __init__(self, data, elf):
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self._shm.buf[:len(data)] = data
+        self.ref = BinaryRef(self._shm.name, len(data), os.path.abspath(elf))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def create_pool(jobs=None, initializer=None, initargs=()):
+    """
+    Create a pool of `jobs` worker processes, or one per CPU. The workers are
+    spawned rather than forked, as the server forks from a threaded process.
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_process,
+        initargs=(initializer, initargs),
+    )
+
+
+def _init_process(initializer, initargs):
+    # Ctrl+C is also sent to the workers, which are shut down by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _attach(name, size):
+    try:
+        _, data = _attached[name]
+    except KeyError:
+        pass
+    else:
+        _attached.move_to_end(name)
+        return data
+
+    shm = shared_memory.SharedMemory(name=name)
+    data = shm.buf[:size].toreadonly()
+    _attached[name] = (shm, data)
+
+    while len(_attached) > ATTACH_LIMIT:
+        _detach(*_attached.popitem(last=False))
+
+    return data
+
+
+def _detach(name, attached):
+    shm, data = attached
+
+    try:
+        data.release()
+        shm.close()
+    except BufferError:
+        # Still referenced, the mapping is released once it is collected
+        pass
+
+
+@atexit.register
+def _detach_all():
+    while _attached:
+        _detach(*_attached.popitem())
+
+
+def _load_symbols(path):
+    mtime = os.stat(path).st_mtime_ns
+    cached = _symbols.get(path)
+
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'rb') as f:
+        syms = symbols.Symbols(f)
+
+    _symbols[path] = (mtime, syms)
+    return syms
+
+
+def load(ref):
+    """
+    Return the data and symbols of the shared binary `ref` in a worker
+    process. Both are kept for the next jobs, and the symbols are reloaded
+    once the ELF file changes.
+    """
+    return _attach(ref.name, ref.size), _load_symbols(ref.elf)
+
+
+def disassembler(data):
+    """
+    Create a disassembler that shares the decoded instructions of the
+    current worker process.
+    """
+    return disasm.Disassembler(data, _decode_cache)
+
+
+def diff_function(base, modified, base_address, modified_address, normalize=False, html=None):
+    """
+    Diff the function at `base_address` in the shared binary `base` with the
+    function at `modified_address` in `modified`. Only the diff rows are
+    sent back, not the disassembled functions.
+    """
+    base_data, base_symbols = load(base)
+    modified_data, modified_symbols = load(modified)
+
+    original = disassembler(base_data).disassemble(base_address, base_symbols)
+    modified = disassembler(modified_data).disassemble(modified_address, modified_symbols)
+
+    differ = diff.DisasmDiff(html=html, normalize=normalize)
+    return list(differ.diff(original, modified))
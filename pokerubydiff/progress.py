@@ -0,0 +1,242 @@
+import time
+import sqlite3
+import collections
+from .callgraph import function_digest
+from .disasm import address_to_offset
+
+# The ROMs are compared in blocks of this many bytes to find the functions
+# whose bytes changed since the previous build
+BLOCK_SIZE = 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    functions INTEGER NOT NULL,
+    matching INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    matching_size INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS functions (
+    name TEXT PRIMARY KEY,
+    address INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    base_hash BLOB,
+    matching INTEGER NOT NULL,
+    since INTEGER NOT NULL REFERENCES builds (id)
+);
+'''
+
+FunctionProgress = collections.namedtuple(
+    'FunctionProgress',
+    'name address size hash base_hash matching since',
+)
+
+
+def changed_blocks(previous, data):
+    """
+    Return the indices of the blocks of `data` that differ from `previous`,
+    or None if the sizes differ and every block should be treated as changed.
+    """
+    if len(previous) != len(data):
+        return None
+
+    if previous == data:
+        return set()
+
+    return {
+        i // BLOCK_SIZE for i in range(0, len(data), BLOCK_SIZE)
+        if previous[i:i+BLOCK_SIZE] != data[i:i+BLOCK_SIZE]
+    }
+
+
+class ProgressStore:
+    """
+    A record of which functions of the modified build match the base build,
+    kept in an SQLite database across builds and sessions. Every function is
+    hashed on the first update of a session. Later updates compare the ROM
+    with the previous build and only hash the functions whose bytes changed
+    or that moved.
+    """
+    def __init__(self, path):
+        # Updates are made from the build thread, queries from any thread
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._base = {}
+        self._previous = None
+        self._functions = {
+            row[0]: FunctionProgress(*row)
+            for row in self._db.execute('SELECT * FROM functions')
+        }
+
+    def close(self):
+        self._db.close()
+
+    def set_base(self, data, symbols):
+        """
+        Hash the functions of the base build, which the functions of the
+        modified build are compared to.
+        """
+        self._base = {}
+
+        for symbol in symbols.functions():
+            if symbol.size == 0:
+                continue
+
+            try:
+                self._base[symbol.name] = function_digest(data, symbol.value & 0xFFFFFFFE,
+                                                          symbol.size)
+            except ValueError:
+                continue
+
+        # The match status of every function has to be checked again
+        self._previous = None
+
+    def update(self, data, symbols):
+        """
+        Record the progress of the modified build `data`. Returns the summary
+        of the build, the number of functions hashed and the functions that
+        started or stopped matching.
+        """
+        changed = None if self._previous is None else changed_blocks(self._previous, data)
+        now = time.time()
+
+        with self._db:
+            build = self._db.execute(
+                'INSERT INTO builds (time, functions, matching, size, matching_size) '
+                'VALUES (?, 0, 0, 0, 0)',
+                (now,),
+            ).lastrowid
+
+            functions = {}
+            updated = []
+            matched = []
+            unmatched = []
+
+            for symbol in symbols.functions():
+                if symbol.size == 0:
+                    continue
+
+                address = symbol.value & 0xFFFFFFFE # Ignore THUMB bit
+                entry = self._functions.get(symbol.name)
+
+                try:
+                    offset = address_to_offset(address)
+                except ValueError:
+                    # Not in ROM, e.g. code copied to IWRAM
+                    continue
+
+                if entry and entry.address == address and entry.size == symbol.size and \
+                   changed is not None and not self._overlaps(changed, offset, symbol.size):
+                    functions[symbol.name] = entry
+                    continue
+
+                digest = function_digest(data, address, symbol.size)
+                base_digest = self._base.get(symbol.name)
+                matching = digest == base_digest
+
+                # Only functions that were recorded before can start or stop matching
+                since = build
+                if entry and entry.matching == matching:
+                    since = entry.since
+                elif entry and matching:
+                    matched.append(symbol.name)
+                elif entry:
+                    unmatched.append(symbol.name)
+
+                entry = FunctionProgress(symbol.name, address, symbol.size, digest, base_digest,
+                                         matching, since)
+                functions[symbol.name] = entry
+                updated.append(entry)
+
+            removed = self._functions.keys() - functions.keys()
+            self._functions = functions
+
+            self._db.executemany('INSERT OR REPLACE INTO functions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 updated)
+            self._db.executemany('DELETE FROM functions WHERE name = ?',
+                                 ((name,) for name in removed))
+
+            summary = self._summary(build, now)
+            self._db.execute(
+                'UPDATE builds SET functions = ?, matching = ?, size = ?, matching_size = ? '
+                'WHERE id = ?',
+                (summary['functions'], summary['matching'], summary['size'],
+                 summary['matching_size'], build),
+            )
+
+        self._previous = data
+
+        return {
+            **summary,
+            'hashed': len(updated),
+            'matched': sorted(matched),
+            'unmatched': sorted(unmatched),
+        }
+
+    def _overlaps(self, changed, offset, size):
+        first = offset // BLOCK_SIZE
+        last = (offset + size - 1) // BLOCK_SIZE
+
+        return any(block in changed for block in range(first, last + 1))
+
+    def _summary(self, build, time):
+        matching = [entry for entry in self._functions.values() if entry.matching]
+
+        return {
+            'build': build,
+            'time': time,
+            'functions': len(self._functions),
+            'matching': len(matching),
+            'size': sum(entry.size for entry in self._functions.values()),
+            'matching_size': sum(entry.size for entry in matching),
+        }
+
+    def summary(self):
+        """
+        The summary of the last build, or None if no build was recorded.
+        """
+        row = self._db.execute(
+            'SELECT id, time, functions, matching, size, matching_size FROM builds '
+            'ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+
+        return row and self._build(row)
+
+    def history(self, limit=None):
+        """
+        The summaries of the last `limit` builds, or of every build, oldest first.
+        """
+        rows = self._db.execute(
+            'SELECT id, time, functions, matching, size, matching_size FROM builds '
+            'ORDER BY id DESC LIMIT ?',
+            (-1 if limit is None else limit,),
+        ).fetchall()
+
+        return [self._build(row) for row in reversed(rows)]
+
+    def _build(self, row):
+        return dict(zip(('build', 'time', 'functions', 'matching', 'size', 'matching_size'), row))
+
+    def status(self, name):
+        """
+        The progress of the function `name`, or None if it is not in the
+        modified build.
+        """
+        row = self._db.execute('SELECT * FROM functions WHERE name = ?', (name,)).fetchone()
+        return row and FunctionProgress(*row)
+
+    def functions(self, matching=None):
+        """
+        The names of the functions of the modified build, or only those that
+        match or don't match if `matching` is given.
+        """
+        if matching is None:
+            rows = self._db.execute('SELECT name FROM functions ORDER BY address')
+        else:
+            rows = self._db.execute('SELECT name FROM functions WHERE matching = ? ORDER BY address',
+                                    (bool(matching),))
+
+        return [name for name, in rows]
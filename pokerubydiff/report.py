@@ -0,0 +1,153 @@
+import sys
+import json
+from . import symbols
+from . import disasm
+from . import diff
+from . import pool
+
+# Exit codes
+EXIT_MATCH = 0
+EXIT_MISMATCH = 1
+EXIT_ERROR = 2
+
+# The worker state for the current process
+_worker = None
+
+
+class Worker:
+    """
+    Diffs functions between two builds. Each worker process attaches to the
+    binaries in shared memory and loads its own symbols, so only function
+    names are sent to the workers.
+    """
+    def __init__(self, base, modified, normalize=False):
+        self.normalize = normalize
+        self.base_binary, self.base_symbols = pool.load(base)
+        self.modified_binary, self.modified_symbols = pool.load(modified)
+
+    def _function_bytes(self, data, symbol):
+        offset = disasm.address_to_offset(symbol.value & 0xFFFFFFFE)
+        return data[offset:offset+symbol.size]
+
+    def diff(self, name):
+        base_symbol = self.base_symbols.lookup_name(name)
+        modified_symbol = self.modified_symbols.lookup_name(name)
+        result = {
+            'function': name,
+        }
+
+        if base_symbol == None or modified_symbol == None:
+            return {**result, 'status': 'missing'}
+
+        base_address = base_symbol.value & 0xFFFFFFFE # Ignore THUMB bit
+        modified_address = modified_symbol.value & 0xFFFFFFFE
+        result['address'] = base_address
+        result['modified_address'] = modified_address
+
+        try:
+            # Functions with identical bytes don't need to be diffed
+            if base_symbol.size and base_symbol.size == modified_symbol.size and \
+               self._function_bytes(self.base_binary, base_symbol) == \
+               self._function_bytes(self.modified_binary, modified_symbol):
+                return {**result, 'status': 'match'}
+
+            original = pool.disassembler(self.base_binary).disassemble(
+                base_address,
+                self.base_symbols,
+            )
+            modified = pool.disassembler(self.modified_binary).disassemble(
+                modified_address,
+                self.modified_symbols,
+            )
+
+            differ = diff.DisasmDiff(normalize=self.normalize)
+            diff_data = list(differ.diff(original, modified))
+        except Exception as e:
+            # Any failure only fails this function, and sets the exit code
+            return {**result, 'status': 'error', 'error': repr(e)}
+
+        if all(row['opcode'] == ' ' for row in diff_data):
+            return {**result, 'status': 'match'}
+
+        return {**result, 'status': 'mismatch', 'diff': diff_data}
+
+
+def _init_worker(*args):
+    global _worker
+    _worker = Worker(*args)
+
+
+def _diff_function(name):
+    return _worker.diff(name)
+
+
+def _function_names(base_elf):
+    with open(base_elf, 'rb') as f:
+        base_symbols = symbols.Symbols(f)
+
+    return [symbol.name for symbol in base_symbols.functions() if symbol.size]
+
+
+def run(base_elf, base_rom, modified_elf, modified_rom, functions=None, *,
+        jobs=None, format='jsonl', output=sys.stdout, normalize=False):
+    """
+    Diff `functions`, or every function in the base ELF, and write the
+    results to `output` as JSON lines or a single JSON document. Returns
+    the exit code: EXIT_MATCH if every function matches, EXIT_ERROR if any
+    function could not be disassembled or diffed, and EXIT_MISMATCH otherwise.
+    """
+    if not functions:
+        functions = _function_names(base_elf)
+
+    with open(base_rom, 'rb') as f:
+        base_binary = f.read()
+
+    with open(modified_rom, 'rb') as f:
+        modified_binary = f.read()
+
+    # The workers attach to the binaries rather than each reading its own copy
+    base = pool.SharedBinary(base_binary, base_elf)
+    modified = pool.SharedBinary(modified_binary, modified_elf)
+    del base_binary, modified_binary
+
+    worker_args = (base.ref, modified.ref, normalize)
+
+    if jobs == 1:
+        _init_worker(*worker_args)
+        results = map(_diff_function, functions)
+        executor = None
+    else:
+        executor = pool.create_pool(jobs, _init_worker, worker_args)
+        results = executor.map(_diff_function, functions, chunksize=16)
+
+    summary = dict.fromkeys(('match', 'mismatch', 'missing', 'error'), 0)
+    collected = []
+
+    try:
+        for result in results:
+            summary[result['status']] += 1
+
+            if format == 'jsonl':
+                output.write(json.dumps(result) + '\n')
+            else:
+                collected.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+        base.close()
+        modified.close()
+
+    if format == 'json':
+        json.dump({'summary': summary, 'functions': collected}, output)
+        output.write('\n')
+
+    print(', '.join('{} {}'.format(count, status) for status, count in summary.items()),
+          file=sys.stderr)
+
+    if summary['error']:
+        return EXIT_ERROR
+    elif summary['mismatch'] or summary['missing']:
+        return EXIT_MISMATCH
+    else:
+        return EXIT_MATCH
@@ -2,115 +2,137 @@ import fnmatch
 import subprocess
 import logging
 import threading
+import collections
+import concurrent.futures
 import os.path
 import asyncio
 import hashlib
+import aiohttp
 from aiohttp import web
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from . import parser
 from . import symbols
-from . import disasm
-from . import diff
+from . import cache
+from . import deps
+from .build import BuildError, FastBuilder
 
-HASH_NAME = 'sha1'
-
-class BuildError(Exception):
-    def __init__(self, message):
-        self.message = message
+# The parser (libclang) and disassembler (Capstone) modules are slow to
+# import, so they are only imported once the server is running.
 
+HASH_NAME = 'sha1'
 
-class Server(FileSystemEventHandler):
-    def __init__(self, directory, *, host='localhost', port=5000,
-                 function=None, no_reload_symbols=False):
+# The files that are part of the build
+SOURCE_PATTERNS = ('*.c', '*.s', '*.asm', '*.inc', '*.h')
+
+# Included files, which only become dependencies once a file includes them
+HEADER_PATTERNS = ('*.inc', '*.h')
+
+# The database recording the progress of a project, in its directory
+PROGRESS_DB = 'pokerubydiff.db'
+
+class ProjectLogger(logging.LoggerAdapter):
+    """
+    Prefix the messages of a project with its name, so that the output of
+    several projects can be told apart.
+    """
+    def process(self, msg, kwargs):
+        return '[{}] {}'.format(self.extra['project'], msg), kwargs
+
+
+class WorkerPool:
+    """
+    The worker processes that functions are disassembled and diffed in. They
+    are started once the first job is submitted, so that the disassembler is
+    only imported once the server is running. The pool can be shared by
+    several projects, which then also share the instructions each worker
+    has decoded.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                from . import pool
+                self._executor = pool.create_pool()
+
+        return self._executor.submit(fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+class Project(FileSystemEventHandler):
+    """
+    A pokeruby directory served by the server. Each project has its own
+    watcher, caches and build thread, so that the builds of different
+    projects run concurrently while the builds of a project run in order.
+    """
+    def __init__(self, name, directory, *, function=None, no_reload_symbols=False,
+                 call_graph=False, normalize=False, fast_build=False, progress=False,
+                 decode_cache=None, worker_pool=None, logger=None):
         # TODO: Check if directory is a pokeruby install
         # TODO: Check that the directory contains the necessary files
 
-        self._logger = logging.getLogger('pokerubydiff')
-        self._logger.setLevel(logging.DEBUG)
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-        self._logger.addHandler(ch)
-
-        self._host = host
-        self._port = port
+        self.name = name
+        self._logger = logger or logging.getLogger('pokerubydiff')
+        self._loop = None
         self._cached_messages = []
-        self._directory = directory
+        self._websockets = []
+        self._directory = os.path.abspath(directory)
         self._changed_function = function
-        self._update_file_cache()
-        self._update_symbol_cache()
         self._message_queue = asyncio.Queue()
         self._no_reload_symbols = no_reload_symbols
-
-        paths = [
-            os.path.join(directory, 'src'),
-            os.path.join(directory, 'asm'),
-            os.path.join(directory, 'include'),
+        self._call_graph = call_graph
+        self._normalize = normalize
+        self._callgraph = None
+        self._record_progress = progress
+        self._progress = None
+        self._base_matcher = None
+        self._modified_matcher = None
+        self._decode_cache = decode_cache
+        self._diff_cache = cache.DiffCache()
+        self._pool = worker_pool or WorkerPool()
+        self._owns_pool = worker_pool is None
+        self._shared_base = None
+        self._shared_modified = None
+        self._shared_modified_binary = None
+        self._dependencies = deps.DependencyIndex(self._directory, self._logger)
+        self._fast_builder = FastBuilder(self._directory, self._logger) if fast_build else None
+
+        # Builds are queued on a single thread, and changes to a file that is
+        # already waiting to be built are only built once
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._ready = False
+
+        # The file and symbol caches are loaded in the background once the
+        # server has started, and builds are queued behind them
+        self._broadcast('warming_up', cache=True)
+
+        # Watch everything that might be built, so that new files are seen,
+        # and any other directories with dependencies once they are known
+        self._roots = [
+            os.path.join(self._directory, 'src'),
+            os.path.join(self._directory, 'asm'),
+            os.path.join(self._directory, 'include'),
         ]
+        self._watched = set()
 
         self._observer = Observer(timeout=0.1)
 
-        for p in paths:
+        for p in self._roots:
             self._observer.schedule(self, p, recursive=True)
 
-        public_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'public')
-
-        async def index(request):
-            with open(os.path.join(public_dir, 'index.html')) as f:
-                return web.Response(text=f.read(), content_type='text/html')
-
-        async def socket(request):
-            ws = web.WebSocketResponse()
-            await ws.prepare(request)
-
-            request.app['websockets'].append(ws)
-
-            # New connections should receive the 'diff' event
-            if len(self._cached_messages) > 0:
-                for message in self._cached_messages:
-                    await ws.send_json(message)
-
-            try:
-                async for msg in ws:
-                    if msg.type == aiohttp.WSMsgType.TEXT:
-                        # TODO: Handle client response
-                        print(msg)
-            finally:
-                request.app['websockets'].remove(ws)
-
-            return ws
-
-        async def broadcast_messages(app):
-            while True:
-                type, data = await self._message_queue.get()
-                for ws in app['websockets']:
-                    ws.send_json({
-                        'type': type,
-                        'data': data,
-                    })
-
-
-        async def start_background_tasks(app):
-            app['message_broadcaster'] = app.loop.create_task(broadcast_messages(app))
-
-
-        async def cleanup_background_tasks(app):
-            app['message_broadcaster'].cancel()
-            await app['message_broadcaster']
-
-
-        self._app = web.Application()
-        self._app['websockets'] = []
-        self._app.on_startup.append(start_background_tasks)
-        self._app.on_cleanup.append(cleanup_background_tasks)
-        self._app.router.add_get('/', index)
-        self._app.router.add_get('/socket', socket)
-        self._app.router.add_static('/assets', public_dir)
-
-        if self._changed_function != None:
-            self._trigger_build()
-
     def on_created(self, event):
+        if not event.is_directory:
+            self._on_new_file(event.src_path)
+
         if self._observer.__class__.__name__ == 'InotifyObserver':
             # inotify also generates modified events for created files
             return
@@ -124,17 +146,62 @@ class Server(FileSystemEventHandler):
 
     def on_moved(self, event):
         if not event.is_directory:
+            self._on_new_file(event.dest_path)
             self._on_change(event.dest_path)
 
-    def _nop_print(self, *args, **kwargs):
-        pass
-
-    def run(self):
+    def start(self, loop):
+        """
+        Start watching the project and warming up its caches. Messages are
+        broadcast on `loop` from then on.
+        """
+        self._loop = loop
+        self._executor.submit(self._warm_up)
         self._observer.start()
-        self._logger.info('Starting server at http://{}:{}'.format(self._host, self._port))
-        web.run_app(self._app, host=self._host, port=self._port, print=self._nop_print)
+
+    def stop(self):
         self._observer.stop()
         self._observer.join()
+        self._executor.shutdown(wait=False)
+
+        if self._owns_pool:
+            self._pool.shutdown()
+
+        for shared in (self._shared_base, self._shared_modified):
+            if shared is not None:
+                shared.close()
+
+        if self._progress is not None:
+            self._progress.close()
+
+    async def socket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        self._websockets.append(ws)
+
+        # New connections should receive the 'diff' event
+        if len(self._cached_messages) > 0:
+            for message in self._cached_messages:
+                await ws.send_json(message)
+
+        try:
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    # TODO: Handle client response
+                    print(msg)
+        finally:
+            self._websockets.remove(ws)
+
+        return ws
+
+    async def broadcast_messages(self):
+        while True:
+            type, data = await self._message_queue.get()
+            for ws in list(self._websockets):
+                await ws.send_json({
+                    'type': type,
+                    'data': data,
+                })
 
     def _broadcast(self, event, message=None, *, cache=False):
         # Cache the message so that it will be sent when a new client connects
@@ -144,19 +211,75 @@ class Server(FileSystemEventHandler):
                 'data': message,
             })
 
-        self._message_queue.put_nowait((event, message))
+        # Messages are broadcast from the build thread, so they are handed
+        # over to the event loop once it is running
+        if self._loop is None:
+            self._message_queue.put_nowait((event, message))
+        else:
+            self._loop.call_soon_threadsafe(self._message_queue.put_nowait, (event, message))
+
+    def _warm_up(self):
+        try:
+            self._load_caches()
+        except Exception as e:
+            # Nothing can be diffed without the caches, so tell the client
+            # rather than leave it warming up
+            self._logger.exception('Could not load the caches')
+            self._cached_messages = [
+                message for message in self._cached_messages if message['type'] != 'warming_up'
+            ]
+            self._broadcast('build_error', 'Could not load the caches: {}'.format(e), cache=True)
+            return
+
+        self._ready = True
+
+        if self._changed_function != None:
+            try:
+                self._trigger_build()
+            except Exception:
+                self._logger.exception('Build of {} failed'.format(self._changed_function))
+
+    def _load_caches(self):
+        self._logger.info('Loading caches')
+        self._update_file_cache()
+        self._update_symbol_cache()
+        self._update_dependencies()
+
+        if self._call_graph:
+            from . import callgraph
+            self._callgraph = callgraph.CallGraph(self._decode_cache, self._logger)
+
+        if self._record_progress:
+            from . import progress
+            self._progress = progress.ProgressStore(os.path.join(self._directory, PROGRESS_DB))
+            self._progress.set_base(self._original_binary, self._symbolcache)
+
+            summary = self._progress.summary()
+            if summary:
+                self._broadcast('progress', summary, cache=True)
+
+        self._cached_messages = [
+            message for message in self._cached_messages if message['type'] != 'warming_up'
+        ]
+        self._broadcast('ready')
+        self._logger.info('Ready')
 
     def _matches(self, filename, patterns):
         return any(fnmatch.fnmatch(filename, pattern) for pattern in patterns)
 
     def _update_file_cache(self):
+        from . import parser
         self._filecache = parser.cache_files(self._directory, '**/*.c')
 
     def _update_symbol_cache(self):
         """
         Update the cached symbols for the original pokeruby binary file
         """
-        with open(os.path.join(self._directory, 'basepokeruby.elf'), 'rb') as f:
+        from . import pool
+
+        base_elf = os.path.join(self._directory, 'basepokeruby.elf')
+
+        with open(base_elf, 'rb') as f:
             self._symbolcache = symbols.Symbols(f)
 
         with open(os.path.join(self._directory, 'basepokeruby.gba'), 'rb') as f:
@@ -165,9 +288,86 @@ class Server(FileSystemEventHandler):
             h.update(self._original_binary)
             self._original_hash = h.digest()
 
-    def _make(self):
+        if self._shared_base is not None:
+            self._shared_base.close()
+        self._shared_base = pool.SharedBinary(self._original_binary, base_elf)
+
+    def _share(self, modified_binary):
+        """
+        Copy the modified binary to shared memory for the worker processes,
+        replacing the binary of the previous build.
+        """
+        from . import pool
+
+        if self._shared_modified is not None:
+            if self._shared_modified_binary is modified_binary:
+                return self._shared_modified
+            self._shared_modified.close()
+
+        if self._no_reload_symbols:
+            modified_elf = os.path.join(self._directory, 'basepokeruby.elf')
+        else:
+            modified_elf = os.path.join(self._directory, 'pokeruby.elf')
+
+        self._shared_modified = pool.SharedBinary(modified_binary, modified_elf)
+        self._shared_modified_binary = modified_binary
+        return self._shared_modified
+
+    def _update_dependencies(self):
+        """
+        Load the build dependencies and also watch the directories that
+        contain them outside of the source directories.
+        """
+        self._dependencies.load()
+
+        # Files might have been added to the build, which changes the link
+        if self._fast_builder is not None:
+            self._fast_builder.reset()
+
+        roots = tuple(os.path.join(root, '') for root in self._roots)
+
+        for directory in self._dependencies.directories():
+            if directory in self._watched or os.path.join(directory, '').startswith(roots):
+                continue
+
+            if os.path.isdir(directory):
+                self._observer.schedule(self, directory, recursive=False)
+                self._watched.add(directory)
+
+    def _on_new_file(self, path):
+        """
+        Reload the dependencies when a file is added that isn't part of the
+        build yet, as the build might pick it up, e.g. through a wildcard.
+        New headers are picked up once they are built, see _trigger_build.
+        """
+        if not self._matches(path, SOURCE_PATTERNS) or self._matches(path, HEADER_PATTERNS):
+            return
+
+        path = os.path.normpath(path)
+        if len(self._dependencies) == 0 or self._dependencies.is_relevant(path):
+            return
+
+        # Queued ahead of the change, so the build sees the new dependencies
+        self._executor.submit(self._update_dependencies)
+
+    def _make(self, path=None):
+        # Source files can be rebuilt without going through make
+        if self._fast_builder and path and self._matches(path, ('*.c',)):
+            self._logger.info('Starting a new fast build')
+
+            try:
+                built = self._fast_builder.build(path)
+            except BuildError as e:
+                self._logger.info('Build error:\n' + e.message)
+                raise
+
+            if built:
+                self._logger.info('Build success')
+                return
+
         self._logger.info('Starting a new build')
-        proc = subprocess.Popen(['make'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        proc = subprocess.Popen(['make'], cwd=self._directory,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         stdout, stderr = proc.communicate()
 
         if proc.returncode != 0:
@@ -178,22 +378,77 @@ class Server(FileSystemEventHandler):
             self._logger.info('Build success')
 
     def _on_change(self, path):
-        if not self._matches(path, ('*.c', '*.s', '*.asm', '*.inc', '*.h')):
+        if not self._matches(path, SOURCE_PATTERNS):
             return False
 
-        self._trigger_build(path)
+        path = os.path.normpath(path)
+
+        with self._pending_lock:
+            if path in self._pending:
+                return False
+            self._pending.add(path)
+
+        self._executor.submit(self._build_changed, path)
+
+    def _build_changed(self, path):
+        with self._pending_lock:
+            self._pending.discard(path)
+
+        if not self._ready:
+            self._logger.info('Ignoring change to {}, the caches could not be loaded'.format(path))
+            return
+
+        # Ignore files that are not part of the build. This is checked on the
+        # build thread, after any reload of the dependencies for new files.
+        # Headers that aren't dependencies yet might have just been included.
+        if len(self._dependencies) and not self._dependencies.is_relevant(path) and \
+           not self._matches(path, HEADER_PATTERNS):
+            self._logger.debug('Ignoring change to {}'.format(path))
+            return
+
+        try:
+            self._trigger_build(path)
+        except Exception:
+            # Keep the build thread alive for the next change
+            self._logger.exception('Build of {} failed'.format(path))
 
     def _trigger_build(self, path=None):
+        from . import parser
+
         self._cached_messages = []
 
         # 1. Trigger a rebuild
         self._broadcast('building')
         try:
-            self._make()
+            self._make(path)
         except BuildError as e:
             self._broadcast('build_error', e.message, cache=True)
             return
 
+        if path and len(self._dependencies) and not self._dependencies.is_relevant(path):
+            # A header that wasn't a dependency, so make's database is read
+            # again in case a file started including it
+            self._update_dependencies()
+        else:
+            self._dependencies.refresh()
+
+        if path and len(self._dependencies):
+            # Report the functions in the objects that were rebuilt
+            objects = self._dependencies.objects(path)
+            functions = self._dependencies.functions(path)
+
+            self._logger.info('{} affects {} objects and {} functions'.format(
+                os.path.relpath(path, self._directory),
+                len(objects),
+                len(functions),
+            ))
+
+            self._broadcast('affected', {
+                'path': os.path.relpath(path, self._directory),
+                'objects': sorted(os.path.relpath(o, self._directory) for o in objects),
+                'functions': sorted(functions),
+            }, cache=True)
+
         # 2. Check for a match
         with open(os.path.join(self._directory, 'pokeruby.gba'), 'rb') as f:
             modified_binary = f.read()
@@ -205,7 +460,17 @@ class Server(FileSystemEventHandler):
             self._logger.info('Match')
             self._broadcast('match', cache=True)
 
-        # 3. Find change location or load it from the cached location
+        if self._no_reload_symbols:
+            modified_symbols = self._symbolcache
+        else:
+            with open(os.path.join(self._directory, 'pokeruby.elf'), 'rb') as f:
+                modified_symbols = symbols.Symbols(f)
+
+        # 3. Record which functions match
+        if self._progress is not None:
+            self._update_progress(modified_binary, modified_symbols)
+
+        # 4. Find change location or load it from the cached location
         changed_function = None
         if path and self._matches(path, ('*.c',)):
             changed_function = parser.find_changed_function_name(path, self._filecache)
@@ -221,32 +486,294 @@ class Server(FileSystemEventHandler):
             changed_function = self._changed_function
         self._update_file_cache()
 
-        # 4. Get symbol address
-        symbol = self._symbolcache.lookup_name(changed_function)
-        if symbol == None:
+        # 5. Get symbol addresses
+        addresses = self._resolve_function(changed_function, modified_binary, modified_symbols)
+        if addresses == None:
             self._logger.info('Could not find address for function {}'.format(changed_function))
             return
-        address = symbol.value & 0xFFFFFFFE # Ignore THUMB bit
+        original_address, modified_address = addresses
 
-        # 5. Disassemble
-        if self._no_reload_symbols:
-            modified_symbols = self._symbolcache
-        else:
-            with open(os.path.join(self._directory, 'pokeruby.elf'), 'rb') as f:
-                modified_symbols = symbols.Symbols(f)
+        # 6. Disassemble and diff
+        diff_data = self._diff(original_address, modified_address, modified_binary,
+                               modified_symbols, html=os.path.join(self._directory, 'diff.html'))
+
+        # 7. Emit change
+        self._broadcast('diff', diff_data, cache=True)
+
+        # 8. Find the callers affected by the change
+        if self._callgraph is not None:
+            self._update_callgraph(modified_binary, modified_symbols, changed_function)
+
+    def _update_progress(self, modified_binary, modified_symbols):
+        """
+        Record the match status of the functions that changed in this build,
+        and report the progress of the whole build.
+        """
+        progress = self._progress.update(modified_binary, modified_symbols)
+
+        self._logger.info('{matching} of {functions} functions match, {hashed} hashed'.format(
+            **progress
+        ))
+
+        for name in progress['matched']:
+            self._logger.info('{} now matches'.format(name))
+        for name in progress['unmatched']:
+            self._logger.info('{} no longer matches'.format(name))
+
+        self._broadcast('progress', progress, cache=True)
+
+    def _diff_key(self, original_address, modified_address, modified_binary, modified_symbols):
+        """
+        Build the diff cache key from the bytes of both functions and both
+        symbol tables, or None if the size of either function is unknown.
+        """
+        from . import callgraph
+
+        digests = []
+
+        for data, syms, address in ((self._original_binary, self._symbolcache, original_address),
+                                    (modified_binary, modified_symbols, modified_address)):
+            lookup = syms.lookup(address)
+            if not lookup or lookup.disp != 0 or lookup.symbol.size == 0:
+                return None
 
-        original = disasm.Disassembler(self._original_binary).disassemble(
-            address,
-            self._symbolcache,
+            digests.append(callgraph.function_digest(data, address, lookup.symbol.size))
+
+        return (
+            original_address,
+            digests[0],
+            modified_address,
+            digests[1],
+            self._symbolcache.version,
+            modified_symbols.version,
         )
-        modified = disasm.Disassembler(modified_binary).disassemble(
-            address,
-            modified_symbols,
+
+    def _submit_diff(self, original_address, modified_address, modified_binary,
+                     modified_symbols, html=None):
+        """
+        Diff the functions at the given addresses in a worker process. Returns
+        the cache key and a future of the diff rows, which is already done if
+        the same pair of functions has been diffed before.
+        """
+        from . import pool
+
+        key = self._diff_key(original_address, modified_address, modified_binary, modified_symbols)
+        diff_data = self._diff_cache.get(key) if key else None
+
+        if diff_data != None:
+            future = concurrent.futures.Future()
+            future.set_result(diff_data)
+            return None, future
+
+        return key, self._pool.submit(
+            pool.diff_function,
+            self._shared_base.ref,
+            self._share(modified_binary).ref,
+            original_address,
+            modified_address,
+            self._normalize,
+            html,
         )
 
-        # 6. Diff
-        differ = diff.DisasmDiff()
-        diff_data = list(differ.diff(original, modified))
+    def _diff(self, original_address, modified_address, modified_binary, modified_symbols,
+              html=None):
+        """
+        Diff the functions at the given addresses, reusing the result if the
+        same pair of functions has been diffed before.
+        """
+        key, future = self._submit_diff(original_address, modified_address, modified_binary,
+                                        modified_symbols, html)
+        diff_data = future.result()
 
-        # 7. Emit change
-        self._broadcast('diff', diff_data, cache=True)
+        if key:
+            self._diff_cache.put(key, diff_data, len(diff_data))
+
+        self._logger.debug('Diff cache: {hits} hits, {misses} misses, {entries} entries'.format(
+            **self._diff_cache.stats()
+        ))
+
+        return diff_data
+
+    def _resolve_function(self, name, modified_binary, modified_symbols):
+        """
+        Find the address of the function `name` in both binaries. If it only
+        exists in one of them, e.g. because it was renamed, use the most
+        similar function in the other binary.
+        """
+        from . import disasm
+        from . import matcher
+
+        original_symbol = self._symbolcache.lookup_name(name)
+        modified_symbol = modified_symbols.lookup_name(name)
+
+        if original_symbol != None:
+            original_address = original_symbol.value & 0xFFFFFFFE # Ignore THUMB bit
+        if modified_symbol != None:
+            modified_address = modified_symbol.value & 0xFFFFFFFE
+
+        if original_symbol != None and modified_symbol != None:
+            return original_address, modified_address
+
+        if original_symbol != None:
+            if self._modified_matcher == None:
+                self._modified_matcher = matcher.FunctionMatcher(self._decode_cache, self._logger)
+
+            self._logger.info('Indexing the functions of the modified binary')
+            self._modified_matcher.update(modified_binary, modified_symbols)
+            function_matcher = self._modified_matcher
+
+            items = disasm.Disassembler(self._original_binary, self._decode_cache).disassemble(
+                original_address,
+                self._symbolcache,
+            )
+        elif modified_symbol != None:
+            if self._base_matcher == None:
+                self._logger.info('Indexing the functions of the original binary')
+                self._base_matcher = matcher.FunctionMatcher(self._decode_cache, self._logger)
+                self._base_matcher.update(self._original_binary, self._symbolcache)
+            function_matcher = self._base_matcher
+
+            items = disasm.Disassembler(modified_binary, self._decode_cache).disassemble(
+                modified_address,
+                modified_symbols,
+            )
+        else:
+            return None
+
+        # A renamed function is missing from the other binary, so prefer the
+        # functions that are only in the binary being searched
+        other_symbols = modified_symbols if original_symbol == None else self._symbolcache
+        names = {
+            name for name in function_matcher.names() if other_symbols.lookup_name(name) == None
+        }
+
+        match = function_matcher.best_match(matcher.fingerprint(items), names or None)
+        if match == None:
+            return None
+
+        match_name, score = match
+        self._logger.info('Matched function {} to {} ({:.0%} similar)'.format(name, match_name, score))
+
+        if original_symbol != None:
+            return original_address, function_matcher.address(match_name)
+        else:
+            return function_matcher.address(match_name), modified_address
+
+    def _update_callgraph(self, modified_binary, modified_symbols, changed_function):
+        """
+        Reindex the functions that changed in the modified binary and report
+        their callers.
+        """
+        if len(self._callgraph) == 0:
+            # Index the original binary first, so that the first build
+            # reports the functions that differ from it
+            self._logger.info('Building the call graph')
+            self._callgraph.update(self._original_binary, self._symbolcache)
+
+        changed = self._callgraph.update(modified_binary, modified_symbols)
+        changed.add(changed_function)
+        callers = self._callgraph.affected(changed)
+
+        self._logger.info('{} changed functions affect {} callers'.format(
+            len(changed),
+            len(callers),
+        ))
+
+        self._broadcast('callers', {
+            'function': changed_function,
+            'changed': sorted(changed),
+            'callers': sorted(callers),
+        }, cache=True)
+
+
+class Server:
+    """
+    Serve the diffs of one or more projects. `projects` maps the name of
+    each project to its directory, or is the directory of a single project.
+    The first project is served at '/' and every project at '/<name>/'.
+    """
+    def __init__(self, projects, *, host='localhost', port=5000, **options):
+        if isinstance(projects, str):
+            projects = {os.path.basename(os.path.abspath(projects)): projects}
+
+        self._logger = logging.getLogger('pokerubydiff')
+        self._logger.setLevel(logging.DEBUG)
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.DEBUG)
+        self._logger.addHandler(ch)
+
+        self._host = host
+        self._port = port
+
+        # Instructions decode the same in every project that contains the
+        # same bytes at the same address, so the decode cache of the call
+        # graphs and matchers and the worker processes are shared
+        decode_cache = cache.DecodeCache()
+        self._worker_pool = WorkerPool()
+
+        self._projects = collections.OrderedDict()
+        for name, directory in projects.items():
+            logger = ProjectLogger(self._logger, {'project': name}) if len(projects) > 1 else None
+            self._projects[name] = Project(name, directory, decode_cache=decode_cache,
+                                           worker_pool=self._worker_pool, logger=logger,
+                                           **options)
+
+        public_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'public')
+
+        async def index(request):
+            with open(os.path.join(public_dir, 'index.html')) as f:
+                return web.Response(text=f.read(), content_type='text/html')
+
+        def project(request):
+            try:
+                return self._projects[request.match_info['project']]
+            except KeyError:
+                raise web.HTTPNotFound()
+
+        async def project_index(request):
+            project(request)
+            return await index(request)
+
+        async def project_socket(request):
+            return await project(request).socket(request)
+
+        async def start_background_tasks(app):
+            app['message_broadcasters'] = [
+                app.loop.create_task(p.broadcast_messages()) for p in self._projects.values()
+            ]
+
+            for p in self._projects.values():
+                p.start(app.loop)
+
+        async def cleanup_background_tasks(app):
+            for p in self._projects.values():
+                p.stop()
+
+            self._worker_pool.shutdown()
+
+            for task in app['message_broadcasters']:
+                task.cancel()
+            await asyncio.gather(*app['message_broadcasters'], return_exceptions=True)
+
+        default = next(iter(self._projects.values()))
+
+        self._app = web.Application()
+        self._app.on_startup.append(start_background_tasks)
+        self._app.on_cleanup.append(cleanup_background_tasks)
+        self._app.router.add_static('/assets', public_dir)
+        self._app.router.add_get('/', index)
+        self._app.router.add_get('/socket', default.socket)
+        self._app.router.add_get('/{project}/', project_index)
+        self._app.router.add_get('/{project}/socket', project_socket)
+
+    def _nop_print(self, *args, **kwargs):
+        pass
+
+    def run(self):
+        self._logger.info('Starting server at http://{}:{}'.format(self._host, self._port))
+
+        if len(self._projects) > 1:
+            for name in self._projects:
+                self._logger.info('Serving {} at http://{}:{}/{}/'.format(name, self._host, self._port, name))
+
+        web.run_app(self._app, host=self._host, port=self._port, print=self._nop_print)
@@ -1,4 +1,5 @@
 import bisect
+import hashlib
 import operator
 from . import elf
 
@@ -19,6 +20,7 @@ class Symbols:
 
         self._by_name = {}
         by_address = []
+        entries = []
 
         for symbol in elf.symbols(file):
             # Exclude THUMB bit
@@ -27,6 +29,10 @@ class Symbols:
 
             self._by_name[symbol.name] = symbol
             by_address.append((start, end, symbol))
+            entries.append('{}:{:x}:{:x}'.format(symbol.name, symbol.value, symbol.size))
+
+        # Identifies this symbol table, so that results rendered with it can be cached
+        self.version = hashlib.sha1('\n'.join(entries).encode()).hexdigest()
 
         # Create parallel arrays, sorted by start address
         self._start_address, self._end_address, self._symbols = zip(*sorted(
@@ -34,12 +40,17 @@ class Symbols:
             key=operator.itemgetter(0),
         ))
 
+    def functions(self):
+        """
+        Iterate over the function symbols in address order
+        """
+        return (symbol for symbol in self._symbols if symbol.type == ST_FUNCTION)
+
     def lookup_name(self, name, default=None):
         return self._by_name.get(name, default)
 
-    def lookup(self, address, default=None):
-        i = bisect.bisect_right(self._start_address, address)
-
+    def _lookup_before(self, i, address):
+        # Check the symbol starting before index `i` of the sorted arrays
         if i:
             end_address = self._end_address[i - 1]
             symbol = self._symbols[i - 1]
@@ -47,4 +58,28 @@ class Symbols:
             if symbol.size == 0 or address < end_address:
                 return SymbolLookup(address, symbol)
 
-        return default
+        return None
+
+    def lookup(self, address, default=None):
+        i = bisect.bisect_right(self._start_address, address)
+        lookup = self._lookup_before(i, address)
+
+        return default if lookup is None else lookup
+
+    def lookup_many(self, addresses):
+        """
+        Look up a batch of addresses, and return a dict mapping each address
+        that is inside a symbol to its lookup. The addresses are visited in
+        order, so every search starts where the previous one ended.
+        """
+        result = {}
+        i = 0
+
+        for address in sorted(set(addresses)):
+            i = bisect.bisect_right(self._start_address, address, i)
+            lookup = self._lookup_before(i, address)
+
+            if lookup is not None:
+                result[address] = lookup
+
+        return result
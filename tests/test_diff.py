@@ -0,0 +1,46 @@
+from pokerubydiff import disasm
+from pokerubydiff import diff
+
+ADDRESS = 0x08000000
+
+# push {lr}; movs r0, #0; loop: adds r0, #1; cmp r0, #10; blt loop; pop {r0}; bx r0
+BASE = bytes.fromhex('00b5' '0020' '0130' '0a28' 'fcdb' '01bc' '0047') + bytes(16)
+
+# The same loop with 'adds r1, #1' inserted before the backward branch
+MODIFIED = bytes.fromhex('00b5' '0020' '0130' '0131' '0a28' 'fbdb' '01bc' '0047') + bytes(16)
+
+
+def disassemble(data):
+    return list(disasm.Disassembler(data).disassemble(ADDRESS))
+
+
+def test_normalized_insert_before_backward_branch():
+    rows = list(diff.DisasmDiff(normalize=True).diff(disassemble(BASE), disassemble(MODIFIED)))
+
+    assert all(isinstance(row, dict) for row in rows)
+    assert [row['text'] for row in rows if row['opcode'] == '+'] == ['adds\tr1, #1']
+
+    # The branch renders the same, but jumps further back
+    assert [(row['opcode'], row['address']) for row in rows if row['text'].startswith('blt')] == [
+        ('<', ADDRESS + 8),
+        ('>', ADDRESS + 10),
+    ]
+
+
+def test_insert_before_backward_branch():
+    rows = list(diff.DisasmDiff().diff(disassemble(BASE), disassemble(MODIFIED)))
+
+    assert all(isinstance(row, dict) for row in rows)
+    assert [row['text'] for row in rows if row['opcode'] == '+'] == ['adds\tr1, #1']
+
+
+
+def test_displaced_rows_carry_modified_text():
+    # Insert 'adds r1, #1' before the loop, which moves all of it
+    moved = bytes.fromhex('00b5' '0131' '0020' '0130' '0a28' 'fcdb' '01bc' '0047') + bytes(16)
+    rows = list(diff.DisasmDiff(normalize=True).diff(disassemble(BASE), disassemble(moved)))
+    branch, = [row for row in rows if row['text'].startswith('blt')]
+
+    assert branch['displacement'] == 2
+    assert branch['text'] == 'blt\tloc_8000004'
+    assert branch['modified']['text'] == 'blt\tloc_8000006'
@@ -0,0 +1,138 @@
+import collections
+from pokerubydiff import disasm
+from pokerubydiff import symbols
+
+ADDRESS = 0x08000000
+
+Symbol = collections.namedtuple('Symbol', 'name value size type')
+
+# A GCC switch statement with three cases and a default, all joining the
+# epilogue. The third case uses 'bl' as a long branch.
+SWITCH = bytes.fromhex(
+    '00b5'      # 00: push {lr}
+    '0228'      # 02: cmp r0, #2
+    '12d8'      # 04: bhi loc_800002C
+    '8000'      # 06: lsls r0, r0, #2
+    '0149'      # 08: ldr r1, =off_8000014
+    '4018'      # 0A: adds r0, r0, r1
+    '0068'      # 0C: ldr r0, [r0]
+    '8746'      # 0E: mov pc, r0
+    '14000008'  # 10: .word off_8000014
+    '20000008'  # 14: .word loc_8000020
+    '24000008'  # 18: .word loc_8000024
+    '28000008'  # 1C: .word loc_8000028
+    '0120'      # 20: movs r0, #1
+    '04e0'      # 22: b loc_800002E
+    '0220'      # 24: movs r0, #2
+    '02e0'      # 26: b loc_800002E
+    '00f001f8'  # 28: bl loc_800002E
+    '0020'      # 2C: movs r0, #0
+    '02bc'      # 2E: pop {r1}
+    '0847'      # 30: bx r1
+) + bytes(16)
+
+SWITCH_SIZE = 0x32
+
+
+class StubSymbols:
+    """
+    The lookups of symbols.Symbols for a single function symbol.
+    """
+    def __init__(self, name, address, size):
+        self._symbol = Symbol(name, address | 1, size, symbols.ST_FUNCTION)
+
+    def lookup(self, address, default=None):
+        if ADDRESS <= address < ADDRESS + self._symbol.size:
+            return symbols.SymbolLookup(address, self._symbol)
+        return default
+
+    def lookup_many(self, addresses):
+        return {address: self.lookup(address) for address in addresses if self.lookup(address)}
+
+
+def analyse():
+    return disasm.Disassembler(SWITCH).analyse(ADDRESS, StubSymbols('Switch', ADDRESS, SWITCH_SIZE))
+
+
+def items_by_address(function):
+    return {item.address(): item for item in function.items}
+
+
+def test_jump_table_targets():
+    items = items_by_address(analyse())
+
+    assert items[ADDRESS + 0xE].flags & disasm.INSN_INDIRECT
+    assert {items[ADDRESS + offset].label for offset in (0x20, 0x24, 0x28)} == {
+        'loc_8000020', 'loc_8000024', 'loc_8000028',
+    }
+    assert items[ADDRESS + 0x2C].label == 'loc_800002C'
+    assert items[ADDRESS + 0x2E].label == 'loc_800002E'
+
+
+def test_jump_table_data():
+    function = analyse()
+    items = items_by_address(function)
+
+    assert items[ADDRESS + 0x14].label == 'off_8000014'
+    assert [items[ADDRESS + offset].type() for offset in (0x10, 0x14, 0x18, 0x1C)] == ['data'] * 4
+    assert [str(items[ADDRESS + offset]) for offset in (0x14, 0x18, 0x1C)] == [
+        '.word Switch+32', '.word Switch+36', '.word Switch+40',
+    ]
+
+    # Every byte of the function is covered, without any padding
+    assert not any(isinstance(item, disasm.AlignItem) for item in function.items)
+    assert sum(item.size() for item in function.items) == SWITCH_SIZE
+
+
+def test_jump_table_needs_bound():
+    # Without the 'cmp' the size of the table is unknown, so it isn't followed
+    data = bytearray(SWITCH)
+    data[2:4] = bytes.fromhex('c046') # nop
+    function = disasm.Disassembler(bytes(data)).analyse(
+        ADDRESS, StubSymbols('Switch', ADDRESS, SWITCH_SIZE),
+    )
+
+    code = {item.address() for item in function.items if item.type() == 'code'}
+
+    assert not code & {ADDRESS + 0x20, ADDRESS + 0x24, ADDRESS + 0x28}
+
+
+def test_bl_within_function_is_branch():
+    insn = items_by_address(analyse())[ADDRESS + 0x28]
+
+    assert not insn.is_call()
+    assert insn.is_unconditional_jump()
+    assert insn.flags & disasm.INSN_BRANCH
+
+
+def test_bl_without_function_size_is_call():
+    insn = items_by_address(disasm.Disassembler(SWITCH).analyse(ADDRESS))[ADDRESS + 0x28]
+
+    assert insn.is_call()
+    assert not insn.flags & disasm.INSN_BRANCH
+
+
+def test_basic_blocks():
+    blocks = {
+        block.address - ADDRESS: (block.size, tuple(sorted(s - ADDRESS for s in block.successors)))
+        for block in analyse().blocks
+    }
+
+    assert blocks == {
+        0x00: (6, (0x06, 0x2C)),
+        0x06: (10, (0x20, 0x24, 0x28)),
+        0x20: (4, (0x2E,)),
+        0x24: (4, (0x2E,)),
+        0x28: (4, (0x2E,)),
+        # Falls through into the epilogue, which was already decoded
+        0x2C: (2, (0x2E,)),
+        0x2E: (4, ()),
+    }
+
+
+def test_joined_code_is_decoded_once():
+    function = analyse()
+    code = [item.address() for item in function.items if item.type() == 'code']
+
+    assert len(code) == len(set(code))
+    assert code.count(ADDRESS + 0x2E) == 1
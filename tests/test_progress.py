@@ -0,0 +1,137 @@
+import collections
+from pokerubydiff import progress
+from pokerubydiff import symbols
+
+ADDRESS = 0x08000000
+
+Symbol = collections.namedtuple('Symbol', 'name value size type')
+
+
+class StubSymbols:
+    """
+    The function symbols of symbols.Symbols, given as name: (offset, size).
+    """
+    def __init__(self, functions):
+        self._symbols = [
+            Symbol(name, (ADDRESS + offset) | 1, size, symbols.ST_FUNCTION)
+            for name, (offset, size) in functions.items()
+        ]
+
+    def functions(self):
+        return iter(self._symbols)
+
+
+# One function in each of the first three blocks
+FUNCTIONS = {
+    'f': (0, 16),
+    'g': (progress.BLOCK_SIZE, 16),
+    'h': (2 * progress.BLOCK_SIZE, 16),
+}
+
+
+def rom(**functions):
+    """
+    A ROM of four blocks, with the bytes of the given functions filled in.
+    """
+    data = bytearray(4 * progress.BLOCK_SIZE)
+
+    for name, fill in functions.items():
+        offset, size = FUNCTIONS[name]
+        data[offset:offset+size] = bytes((fill,)) * size
+
+    return bytes(data)
+
+
+BASE = rom(f=1, g=2, h=3)
+
+
+def store(tmp_path):
+    progress_store = progress.ProgressStore(str(tmp_path / 'progress.db'))
+    progress_store.set_base(BASE, StubSymbols(FUNCTIONS))
+    return progress_store
+
+
+def test_changed_blocks():
+    assert progress.changed_blocks(BASE, BASE) == set()
+    assert progress.changed_blocks(BASE, rom(f=1, g=4, h=3)) == {1}
+    assert progress.changed_blocks(BASE, BASE + bytes(1)) is None
+
+
+def test_first_update_hashes_everything(tmp_path):
+    result = store(tmp_path).update(rom(f=1, g=4, h=3), StubSymbols(FUNCTIONS))
+
+    assert result['hashed'] == 3
+    assert result['functions'] == 3
+    assert result['matching'] == 2
+    assert result['matching_size'] == 32
+
+    # Nothing was recorded before, so nothing started or stopped matching
+    assert result['matched'] == []
+    assert result['unmatched'] == []
+
+
+def test_only_changed_functions_are_hashed(tmp_path):
+    s = store(tmp_path)
+    first = s.update(BASE, StubSymbols(FUNCTIONS))
+
+    result = s.update(rom(f=1, g=4, h=3), StubSymbols(FUNCTIONS))
+    assert result['hashed'] == 1
+    assert result['unmatched'] == ['g']
+    assert result['matching'] == 2
+    assert s.status('g').since == result['build']
+    assert s.status('f').since == first['build']
+
+    result = s.update(BASE, StubSymbols(FUNCTIONS))
+    assert result['hashed'] == 1
+    assert result['matched'] == ['g']
+    assert result['matching'] == 3
+
+    result = s.update(BASE, StubSymbols(FUNCTIONS))
+    assert result['hashed'] == 0
+    assert s.status('f').since == first['build']
+
+
+def test_moved_functions_are_hashed(tmp_path):
+    s = store(tmp_path)
+    s.update(BASE, StubSymbols(FUNCTIONS))
+
+    # The bytes are the same, but h now starts halfway through its block
+    moved = dict(FUNCTIONS, h=(2 * progress.BLOCK_SIZE + 8, 16))
+    result = s.update(BASE, StubSymbols(moved))
+
+    assert result['hashed'] == 1
+    assert result['unmatched'] == ['h']
+    assert s.status('h').address == ADDRESS + 2 * progress.BLOCK_SIZE + 8
+
+
+def test_removed_functions_are_deleted(tmp_path):
+    s = store(tmp_path)
+    s.update(BASE, StubSymbols(FUNCTIONS))
+
+    remaining = {name: FUNCTIONS[name] for name in ('f', 'g')}
+    result = s.update(BASE, StubSymbols(remaining))
+
+    assert result['hashed'] == 0
+    assert result['functions'] == 2
+    assert s.status('h') is None
+    assert s.functions() == ['f', 'g']
+
+
+def test_progress_is_kept_across_sessions(tmp_path):
+    s = store(tmp_path)
+    first = s.update(rom(f=1, g=4, h=3), StubSymbols(FUNCTIONS))
+    s.close()
+
+    s = store(tmp_path)
+    assert s.summary() == {key: first[key] for key in s.summary()}
+
+    # Every function is hashed again in a new session, and can start
+    # matching relative to the recorded progress
+    result = s.update(BASE, StubSymbols(FUNCTIONS))
+    assert result['hashed'] == 3
+    assert result['matched'] == ['g']
+    assert s.status('f').since == first['build']
+
+    assert [build['matching'] for build in s.history()] == [2, 3]
+    assert s.functions(matching=True) == ['f', 'g', 'h']
+    assert s.functions(matching=False) == []